@@ -0,0 +1,263 @@
+"""End-to-end benchmark of the installer with local stand-ins for git remotes, docker and GitHub.
+
+Every run installs a project headlessly from a generated spec with --profile, then the trace is
+reduced to wall time, subprocess count and process peak RSS per phase. Results are saved as JSON and,
+when a baseline is given, compared with it: a phase slower than the baseline by more than the
+tolerance fails the benchmark.
+
+Usage: python benchmarks/e2e.py [--sizes 1 10 50 200] [--output results.json] [--baseline baseline.json]
+"""
+import argparse
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+MAIN_FILE_PATH = os.path.abspath(main.__file__)
+SIZES = [1, 10, 50, 200]
+RELEASE_TAG_NAME = 'v1.0.0'
+TOLERANCE = 0.25
+# Phases shorter than this are too noisy to be compared with the baseline.
+MIN_COMPARED_SECONDS = 0.05
+
+
+class ReleasesHandler(http.server.BaseHTTPRequestHandler):
+    """Stand-in for `GET /repos/egal/<repo>/releases/latest` of GitHub API"""
+
+    def do_GET(self):
+        etag = f'"{RELEASE_TAG_NAME}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = json.dumps({'tag_name': RELEASE_TAG_NAME}).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def git(path, *args):
+    subprocess.run(
+        ['git', '-C', path, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost', *args],
+        check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def create_template_repos(templates_path):
+    """Create local repos standing in for the GitHub template repos"""
+    for git_repo_url, ref in main.TEMPLATES:
+        repo_path = os.path.join(templates_path, git_repo_url.rsplit('/', 1)[-1])
+        if not os.path.exists(repo_path):
+            os.makedirs(repo_path)
+            git(repo_path, 'init', '--quiet')
+            for i in range(20):
+                os.makedirs(os.path.join(repo_path, 'app', 'Models'), exist_ok=True)
+                with open(os.path.join(repo_path, 'app', 'Models', f'Model{i}.php'), 'w') as file:
+                    file.write('<?php\n\nclass Model {}\n' * 20)
+            with open(os.path.join(repo_path, 'composer.json'), 'w') as file:
+                file.write('{}\n')
+            git(repo_path, 'add', '--all')
+            git(repo_path, 'commit', '--quiet', '--message', 'Template')
+
+        if git_repo_url == main.GITLAB_CI_REPO_URL:
+            stubs_path = os.path.join(repo_path, 'stubs')
+            os.makedirs(stubs_path, exist_ok=True)
+            for file_name in ['.gitlab-ci.yml.stub', '.gitignore', 'LICENSE', 'deploy.gitlab-ci.yml',
+                              'testing.deploy.gitlab-ci.yml']:
+                open(os.path.join(repo_path if '.stub' not in file_name else stubs_path, file_name), 'w').close()
+            for deploy_stub_names, testing_stub_names in main.GITLAB_CI_SERVICE_STUB_NAMES.values():
+                for stub_name in deploy_stub_names + testing_stub_names:
+                    with open(os.path.join(stubs_path, f'{stub_name}.yml.stub'), 'w') as file:
+                        file.write(f'{stub_name}:__SERVICE_NAME__:\n  script:\n    - echo __SERVICE_NAME__\n')
+            git(repo_path, 'add', '--all')
+            git(repo_path, 'commit', '--quiet', '--allow-empty', '--message', 'Stubs')
+
+        if ref != 'HEAD':
+            git(repo_path, 'branch', '--force', ref)
+
+
+def create_fake_binaries(bin_path, templates_path):
+    """Create `git` redirecting GitHub URLs to local repos, and no-op `docker` and `docker-compose`"""
+    os.makedirs(bin_path)
+    binaries = {
+        'git': f'#!/bin/sh\nexec {shutil.which("git")} '
+               f'-c url.file://{templates_path}/.insteadOf=https://github.com/egal/ "$@"\n',
+        'docker': '#!/bin/sh\n[ "$1" = version ] && echo 20.10.0\nexit 0\n',
+        'docker-compose': '#!/bin/sh\necho docker-compose version 1.29.2\n',
+    }
+    for name, content in binaries.items():
+        with open(os.path.join(bin_path, name), 'w') as file:
+            file.write(content)
+        os.chmod(os.path.join(bin_path, name), 0o755)
+
+
+def get_union_seconds(intervals):
+    """Get seconds covered by at least one of the (started_at, finished_at) intervals, in microseconds"""
+    covered = 0
+    covered_until = None
+    for started_at, finished_at in sorted(intervals):
+        if covered_until is not None:
+            started_at = max(started_at, covered_until)
+        if finished_at > started_at:
+            covered += finished_at - started_at
+            covered_until = finished_at
+
+    return covered / 1000 ** 2
+
+
+def summarize_trace(trace):
+    """Reduce trace to wall seconds, subprocess count and process peak RSS of every phase.
+    Spans of the same phase running in parallel (per service workers) are counted by their union,
+    and every subprocess is counted once per phase even if it is inside a worker and a main thread span
+    """
+    events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    main_thread_id = next(
+        event['tid'] for event in trace['traceEvents']
+        if event['ph'] == 'M' and event['args']['name'] == 'MainThread'
+    )
+    subprocess_events = [event for event in events if event['cat'] == 'subprocess']
+
+    phases = {}
+    for event in events:
+        if event['cat'] != 'phase':
+            continue
+        phase = phases.setdefault(event['name'], {'spans': [], 'subprocesses': {}, 'peak_rss': 0})
+        phase['spans'].append((event['ts'], event['ts'] + event['dur']))
+        for child in main.get_profile_subprocesses(event, subprocess_events, main_thread_id):
+            phase['subprocesses'][child['tid'], child['ts']] = (
+                child['ts'], min(child['ts'] + child['dur'], event['ts'] + event['dur'])
+            )
+        # ru_maxrss is the peak of the whole process so far, not of this phase alone.
+        phase['peak_rss'] = max(phase['peak_rss'], event['args']['max_rss'])
+
+    return {
+        name: {
+            'seconds': get_union_seconds(phase['spans']),
+            'subprocesses': len(phase['subprocesses']),
+            'subprocess_seconds': get_union_seconds(phase['subprocesses'].values()),
+            'peak_rss': phase['peak_rss'],
+        }
+        for name, phase in phases.items()
+    }, len(subprocess_events)
+
+
+def run_install(size, root_path, environment):
+    """Install project of `size` services into fresh project and cache dirs"""
+    run_path = os.path.join(root_path, f'run-{size}')
+    project_path = os.path.join(run_path, 'project')
+    os.makedirs(project_path)
+    spec_file_name = os.path.join(run_path, 'spec.json')
+    trace_file_name = os.path.join(run_path, 'trace.json')
+    with open(spec_file_name, 'w') as file:
+        json.dump({
+            'name': f'benchmark-{size}',
+            'auth_service': 'Build from context',
+            'services': [f'service-{i}-service' for i in range(size)],
+        }, file)
+
+    started_at = time.perf_counter()
+    subprocess.run(
+        [sys.executable, MAIN_FILE_PATH, '--spec', spec_file_name, '--profile', '--profile-output', trace_file_name, '--jobs', '8'],
+        check=True, cwd=project_path, stdout=subprocess.DEVNULL,
+        env=dict(environment, EGAL_INSTALLER_CACHE_DIR=os.path.join(run_path, 'cache'))
+    )
+    seconds = time.perf_counter() - started_at
+
+    with open(trace_file_name) as file:
+        phases, subprocesses = summarize_trace(json.load(file))
+
+    return {
+        'seconds': seconds,
+        'subprocesses': subprocesses,
+        'phases': phases,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Get descriptions of phases slower than in the baseline"""
+    regressions = []
+    for size, result in results.items():
+        for phase_name, phase in result['phases'].items():
+            baseline_phase = baseline.get(size, {}).get('phases', {}).get(phase_name)
+            if not baseline_phase or baseline_phase['seconds'] < MIN_COMPARED_SECONDS:
+                continue
+            if phase['seconds'] > baseline_phase['seconds'] * (1 + tolerance):
+                regressions.append(
+                    f"{size} services, {phase_name}: {phase['seconds']:.3f}s"
+                    f" (baseline {baseline_phase['seconds']:.3f}s)"
+                )
+            if phase['subprocesses'] > baseline_phase['subprocesses']:
+                regressions.append(
+                    f"{size} services, {phase_name}: {phase['subprocesses']} subprocesses"
+                    f" (baseline {baseline_phase['subprocesses']})"
+                )
+
+    return regressions
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='services counts')
+    parser.add_argument('--output', default='benchmark-results.json', help='results file')
+    parser.add_argument('--baseline', help='results file to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown, 0.25 is 25%%')
+    arguments = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReleasesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root_path:
+        templates_path = os.path.join(root_path, 'templates')
+        bin_path = os.path.join(root_path, 'bin')
+        create_template_repos(templates_path)
+        create_fake_binaries(bin_path, templates_path)
+        environment = dict(
+            os.environ,
+            PATH=bin_path + os.pathsep + os.environ['PATH'],
+            EGAL_INSTALLER_GITHUB_API_URL=f'http://127.0.0.1:{server.server_address[1]}',
+        )
+
+        for size in arguments.sizes:
+            result = run_install(size, root_path, environment)
+            results[str(size)] = result
+            print(f"{size:>4} services: {result['seconds']:.2f}s, {result['subprocesses']} subprocesses")
+            for phase_name, phase in result['phases'].items():
+                print(
+                    f"       {phase_name:<40} {phase['seconds']:>8.3f}s"
+                    f" {phase['subprocesses']:>5} subprocesses {phase['peak_rss'] / 1024:>7.1f} MiB process peak RSS by its end"
+                )
+
+    server.shutdown()
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results saved to `{arguments.output}`.')
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare(results, json.load(file), arguments.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            exit(1)
+        print('No regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,65 @@
+"""Benchmark of GitLab CI stubs rendering.
+
+Renders jobs of 100..800 services from synthetic stubs and prints time per service,
+which has to stay flat as the project grows.
+
+Usage: python benchmarks/gitlab_ci.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+SERVICES_COUNTS = [100, 200, 400, 800]
+REPEAT = 5
+STUB = """__JOB__:__SERVICE_NAME__:
+  extends: .template
+  stage: __JOB__
+  needs:
+    - prepare
+  variables:
+    SERVICE_NAME: __SERVICE_NAME__
+    IMAGE: $CI_REGISTRY_IMAGE/__SERVICE_NAME__:$CI_COMMIT_SHORT_SHA
+  script:
+    - docker-compose build __SERVICE_NAME__
+    - docker-compose push __SERVICE_NAME__
+"""
+TEMPLATE = """.template:
+  image: docker:latest
+"""
+
+
+def write_stubs(gitlab_ci_dir_path):
+    os.makedirs(f'{gitlab_ci_dir_path}/stubs')
+    with open(f'{gitlab_ci_dir_path}/deploy.gitlab-ci.yml', 'w') as file:
+        file.write(TEMPLATE)
+    for deploy_stub_names, testing_stub_names in main.GITLAB_CI_SERVICE_STUB_NAMES.values():
+        for stub_name in deploy_stub_names + testing_stub_names:
+            with open(f'{gitlab_ci_dir_path}/stubs/{stub_name}.yml.stub', 'w') as file:
+                file.write(STUB.replace('__JOB__', stub_name))
+
+
+def render(stubs, services):
+    deploy, testing = main.render_gitlab_ci(stubs, services)
+    testing += main.render_phpcs_config_equals(list(services))
+    return deploy, testing
+
+
+def run():
+    with tempfile.TemporaryDirectory() as gitlab_ci_dir_path:
+        write_stubs(gitlab_ci_dir_path)
+        stubs = main.load_gitlab_ci_stubs(gitlab_ci_dir_path)
+
+    print(f"{'services':>10} {'total, ms':>10} {'per service, us':>16}")
+    for services_count in SERVICES_COUNTS:
+        services = {f'service-{i}-service': {'build': {}} for i in range(services_count)}
+        seconds = min(timeit.repeat(lambda: render(stubs, services), number=1, repeat=REPEAT))
+        print(f'{services_count:>10} {seconds * 1000:>10.2f} {seconds / services_count * 1000 ** 2:>16.1f}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,113 @@
+"""Benchmark of installer startup: time to the banner and to the first prompt.
+
+The source entry point is always measured, frozen binaries (PyInstaller onefile or onedir builds)
+are measured when given with --binary. Platform binaries are replaced with no-op stand-ins and
+release versions are served from a fresh cache, so only the installer itself is measured.
+
+Usage: python benchmarks/startup.py [--runs 10] [--binary dist/main] [--binary dist/egal-installer/egal-installer]
+"""
+import argparse
+import json
+import os
+import pty
+import select
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+BANNER_MARKER = b'Installer'
+PROMPT_MARKER = b'Enter project name'
+TIMEOUT = 30
+
+
+def prepare_environment(root_path):
+    """Create no-op platform binaries and a fresh release versions cache, returns environment for the installer"""
+    bin_path = os.path.join(root_path, 'bin')
+    cache_path = os.path.join(root_path, 'cache')
+    os.makedirs(bin_path)
+    os.makedirs(cache_path)
+
+    for name in ['git', 'docker', 'docker-compose']:
+        with open(os.path.join(bin_path, name), 'w') as file:
+            file.write('#!/bin/sh\nexit 0\n')
+        os.chmod(os.path.join(bin_path, name), 0o755)
+
+    with open(os.path.join(cache_path, 'release-versions.json'), 'w') as file:
+        json.dump({
+            repo_name: {'tag_name': 'v1.0.0', 'etag': None, 'fetched_at': time.time()}
+            for repo_name in ['auth-service', 'rabbitmq', 'web-service']
+        }, file)
+
+    return dict(
+        os.environ,
+        PATH=bin_path + os.pathsep + os.environ['PATH'],
+        EGAL_INSTALLER_CACHE_DIR=cache_path,
+        EGAL_INSTALLER_GITHUB_API_URL='http://127.0.0.1:9',
+    )
+
+
+def measure(command, environment):
+    """Run command in a pseudo terminal until the first prompt.
+    Returns seconds to the banner and to the prompt
+    """
+    with tempfile.TemporaryDirectory() as project_path:
+        master, slave = pty.openpty()
+        started_at = time.perf_counter()
+        process = subprocess.Popen(
+            command, stdin=slave, stdout=slave, stderr=slave, cwd=project_path, env=environment,
+            start_new_session=True
+        )
+        os.close(slave)
+
+        output = b''
+        banner_seconds = None
+        try:
+            while PROMPT_MARKER not in output:
+                if time.perf_counter() - started_at > TIMEOUT:
+                    raise TimeoutError(f'No prompt after {TIMEOUT}s, output: {output[-500:]!r}')
+                if select.select([master], [], [], 0.1)[0]:
+                    output += os.read(master, 65536)
+                if banner_seconds is None and BANNER_MARKER in output:
+                    banner_seconds = time.perf_counter() - started_at
+            prompt_seconds = time.perf_counter() - started_at
+        finally:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            os.close(master)
+
+    return banner_seconds, prompt_seconds
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--binary', action='append', default=[], help='frozen installer binary')
+    arguments = parser.parse_args()
+
+    commands = {'source': [sys.executable, MAIN_FILE_PATH]}
+    for binary in arguments.binary:
+        commands[binary] = [os.path.abspath(binary)]
+
+    with tempfile.TemporaryDirectory() as root_path:
+        environment = prepare_environment(root_path)
+
+        print(f"{'entry point':<40} {'banner, ms':>12} {'prompt, ms':>12} {'prompt min, ms':>15}")
+        for name, command in commands.items():
+            measure(command, environment)  # Warm up file system caches.
+            results = [measure(command, environment) for _ in range(arguments.runs)]
+            banner_times = [banner for banner, _ in results]
+            prompt_times = [prompt for _, prompt in results]
+            print(
+                f'{name:<40}'
+                f' {statistics.median(banner_times) * 1000:>12.0f}'
+                f' {statistics.median(prompt_times) * 1000:>12.0f}'
+                f' {min(prompt_times) * 1000:>15.0f}'
+            )
+
+
+if __name__ == '__main__':
+    run()
@@ -1,22 +1,57 @@
 import os
 
-import requests
-import yaml
-import questionary
 import subprocess
 import random
-import inflection
 import pathlib
 import re
+import argparse
+import json
+import time
+import threading
+import tempfile
+import hashlib
+import filecmp
+import tarfile
+import resource
+import stat
+
+from dataclasses import asdict, dataclass, field
+from contextlib import contextmanager
+from functools import lru_cache
 
 from shutil import copyfile as copy_file
 from os import remove as remove_file
-from rich.console import Console
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sys import exit
 from shutil import rmtree as remove_directory
+from shutil import which, disk_usage, copytree
 from pathlib import Path
 
-console = Console()
+# Heavy third-party packages (rich, questionary, requests, yaml, inflection) are imported
+# where they are used, so the banner and the first prompt show up without waiting for all of them.
+
+
+class LazyConsole:
+    """rich Console created on first use"""
+
+    def __init__(self):
+        self._console = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._console is None:
+            with self._lock:
+                if self._console is None:
+                    from rich.console import Console
+                    self._console = Console()
+
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+console = LazyConsole()
 DOCKER_COMPOSE_VERSION = '3.7'
 DOCKER_COMPOSE_FILE_NAME = 'docker-compose.yml'
 DOCKER_COMPOSE_LOCAL_FILE_NAME = 'docker-compose.local.yml'
@@ -28,26 +63,369 @@ DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME = 'docker-compose.deploy.testing.yml'
 DOT_ENV_FILE_NAME = '.env'
 DOT_ENV_EXAMPLE_FILE_NAME = '.env.example'
 GITIGNORE_FILE_NAME = '.gitignore'
-PLATFORM_REQUIREMENTS = ['git', 'docker', 'docker-compose']
+# Checks every database of POSTGRES_MULTIPLE_DATABASES with one connection and one query,
+# so the probe doesn't grow with services. Missing database fails the query with division by zero.
+POSTGRES_HEALTHCHECK_TEST = (
+    'psql --username=${DB_USERNAME} --dbname=postgres --no-psqlrc --quiet --tuples-only --command="'
+    "WITH expected AS (SELECT unnest(string_to_array('$${POSTGRES_MULTIPLE_DATABASES}', ',')) AS datname)"
+    ' SELECT 1 / (count(pg_database.datname) = count(*))::int FROM expected LEFT JOIN pg_database USING (datname)'
+    '"'
+)
+PLATFORM_REQUIREMENTS = ['git', 'docker', 'docker daemon', 'docker-compose']
+PLATFORM_PROBE_TIMEOUT = 5
+MIN_FREE_DISK_SPACE = 2 * 1024 ** 3
+PROFILE_FILE_NAME = 'egal-installer-profile.json'
+JOURNAL_FILE_NAME = 'egal-installer-journal.json'
+JOURNAL_FORMAT = 1
+SERVICE_JOBS_LIMIT = 4
+STARTUP_TIMEOUT = 300
+PGBOUNCER_PORT = 6432
+PGBOUNCER_MAX_CLIENT_CONN = 1000
+PGBOUNCER_DEFAULT_POOL_SIZE = 20
+PGBOUNCER_RESERVE_POOL_SIZE = 5
+# PDO pgsql prepares named statements on the server, in transaction mode PgBouncer has to track them.
+PGBOUNCER_MAX_PREPARED_STATEMENTS = 100
+POSTGRES_MAX_CONNECTIONS = 100
+POSTGRES_RESERVED_CONNECTIONS = 10
+POSTGRES_PRODUCTION_MEMORY = 4 * 1024 ** 3
+# Limits of every service container, memory in MiB. Reservations are half of the limits.
+SERVICE_SIZING = {
+    'development': {'replicas': 1, 'cpus': 0.5, 'memory': 256},
+    'staging': {'replicas': 1, 'cpus': 1, 'memory': 512},
+    'production': {'replicas': 2, 'cpus': 1, 'memory': 1024},
+}
+PHP_FPM_WORKER_MEMORY = 64
+PHP_FPM_MAX_REQUESTS = 500
+# Pool override per container memory limit in MiB, loaded after `www.conf` and `zz-docker.conf` of the php image.
+PHP_FPM_POOL_FILE_NAME = 'server/php/fpm-{memory}m.conf'
+PHP_FPM_POOL_TARGET = '/usr/local/etc/php-fpm.d/zz-egal-pool.conf'
+RABBITMQ_CONFIG_DIR_NAME = 'server/rabbitmq'
+RABBITMQ_CONFIG_TARGET = '/etc/rabbitmq/conf.d/90-egal.conf'
+RABBITMQ_NOFILE_LIMIT = 65536
+RABBITMQ_PREFETCH_COUNT = 20
+RABBITMQ_MEMORY_HIGH_WATERMARK = 0.6
+# Broker container memory in MiB, the watermark and the free disk limit are derived from it.
+RABBITMQ_ENVIRONMENTS = {
+    'local': {'memory': 512, 'connection_max': 1024, 'channel_max': 128},
+    'testing': {'memory': 512, 'connection_max': 1024, 'channel_max': 128},
+    'development': {'memory': 512, 'connection_max': 1024, 'channel_max': 128},
+    'staging': {'memory': 1024, 'connection_max': 4096, 'channel_max': 256},
+    'production': {'memory': 2048, 'connection_max': 8192, 'channel_max': 256},
+}
+# Dirs of services left out of `docker compose watch` sync, vendor/ comes from the image rebuilt with composer.lock.
+LOCAL_WATCH_IGNORED_DIRS = ['vendor', 'storage/framework', 'bootstrap/cache']
+LOCAL_PHP_INI_FILE_NAME = 'server/php/local.ini'
+LOCAL_PHP_INI_TARGET = '/usr/local/etc/php/conf.d/zz-local.ini'
+LOCAL_PHP_INI_SETTINGS = {
+    'opcache.enable': 1,
+    'opcache.enable_cli': 1,
+    'opcache.memory_consumption': 256,
+    'opcache.interned_strings_buffer': 16,
+    'opcache.max_accelerated_files': 20000,
+    # Every changed file is picked up on the next request.
+    'opcache.validate_timestamps': 1,
+    'opcache.revalidate_freq': 0,
+    'realpath_cache_size': '4096K',
+    'realpath_cache_ttl': 600,
+}
+PROXY_ENVIRONMENTS = {
+    'testing': {
+        'gzip_comp_level': 1, 'proxy_buffer_size': '8k', 'proxy_buffers': '8 8k', 'proxy_busy_buffers_size': '16k',
+        'client_max_body_size': '100m', 'api_micro_cache_valid': None,
+    },
+    'development': {
+        'gzip_comp_level': 1, 'proxy_buffer_size': '8k', 'proxy_buffers': '8 8k', 'proxy_busy_buffers_size': '16k',
+        'client_max_body_size': '100m', 'api_micro_cache_valid': None,
+    },
+    'staging': {
+        'gzip_comp_level': 5, 'proxy_buffer_size': '16k', 'proxy_buffers': '16 16k', 'proxy_busy_buffers_size': '32k',
+        'client_max_body_size': '20m', 'api_micro_cache_valid': '1s',
+    },
+    'production': {
+        'gzip_comp_level': 5, 'proxy_buffer_size': '16k', 'proxy_buffers': '32 16k', 'proxy_busy_buffers_size': '64k',
+        'client_max_body_size': '20m', 'api_micro_cache_valid': '1s',
+    },
+}
+PROXY_HASHED_ASSET_PATTERN = r'^/(?:_nuxt|assets|js|css|img|fonts)/(?:.*[/.-])?[0-9a-f]{7,}\.[0-9a-z]+$'
+PROXY_UPSTREAM_KEEPALIVE = 32
+PROXY_UPSTREAM_PATTERN = re.compile(
+    r'(\bupstream\s+(?:\$\{[^}]*\}|[^\s{};\'"])+\s*\{)((?:\$\{[^}]*\}|[^{}])*?)(\s*\})'
+)
+PROXY_KEEPALIVE_PATTERN = re.compile(r'(?:^|[\s;{])keepalive\s')
+STARTUP_POLL_INTERVAL = 0.5
+GITHUB_API_URL = os.environ.get('EGAL_INSTALLER_GITHUB_API_URL', 'https://api.github.com')
+GITHUB_API_TIMEOUT = 10
+CACHE_DIR = Path(os.environ.get(
+    'EGAL_INSTALLER_CACHE_DIR',
+    Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'egal-installer'
+))
+RELEASE_VERSIONS_CACHE_FILE_NAME = 'release-versions.json'
+RELEASE_VERSIONS_CACHE_TTL = 60 * 60
+RELEASE_VERSIONS_REPOS = ['auth-service', 'rabbitmq', 'web-service']
+TEMPLATES_CACHE_DIR = CACHE_DIR / 'templates'
+COMPOSER_CACHE_DIR = CACHE_DIR / 'composer'
+COMPOSER_INSTALL_TIMES_FILE_NAME = 'composer-install-times.json'
+CLIENT_TYPES = ['Vue.js', 'Nuxt.js']
+AUTH_SERVICE_TYPES = ['Build from image', 'Build from context']
+YAML_COMMENT_PATTERN = re.compile(r'(^|\s)#')
+SERVICE_NAME_PATTERN = re.compile(r'[a-z0-9][a-z0-9-]*')
+SERVICE_NAME_FORMAT = 'lowercase letters, digits and dashes, starting with a letter or a digit'
+RESERVED_SERVICE_NAMES = [
+    'client', 'postgres', 'pgbouncer', 'rabbitmq', 'web-service', 'auth-service', 'php', 'proxy',
+]
+PHP_PROJECT_REPO_URL = 'https://github.com/egal/php-project.git'
+AUTH_SERVICE_REPO_URL = 'https://github.com/egal/auth-service.git'
+GITLAB_CI_REPO_URL = 'https://github.com/egal/gitlab-ci.git'
+CLIENT_TEMPLATES = {
+    'Vue.js': ('https://github.com/egal/vue-project.git', 'vue3-template'),
+    'Nuxt.js': ('https://github.com/egal/nuxt-project.git', 'HEAD'),
+}
+TEMPLATES = [
+    (PHP_PROJECT_REPO_URL, 'HEAD'),
+    (AUTH_SERVICE_REPO_URL, 'HEAD'),
+    (GITLAB_CI_REPO_URL, 'HEAD'),
+    *CLIENT_TEMPLATES.values(),
+]
+BUNDLE_FILE_NAME = 'egal-installer-bundle.tar.gz'
+BUNDLE_MANIFEST_FILE_NAME = 'manifest.json'
+BUNDLE_FORMAT = 1
+BUNDLES_CACHE_DIR = CACHE_DIR / 'bundles'
+GITLAB_CI_DIR_NAME = '.gitlab-ci'
+GITLAB_CI_DEPLOY_FILE_NAME = f'{GITLAB_CI_DIR_NAME}/deploy.gitlab-ci.yml'
+GITLAB_CI_TESTING_FILE_NAME = f'{GITLAB_CI_DIR_NAME}/testing.deploy.gitlab-ci.yml'
+GITLAB_CI_SERVICE_STUB_NAMES = {
+    # Service definition key: stubs for `deploy.gitlab-ci.yml`, stubs for `testing.deploy.gitlab-ci.yml`.
+    'build': (['build-service-image', 'migration-needs-build', 'deploy-needs-build'], ['phpcs', 'phpunit']),
+    'image': (['pull-service-image', 'migration-needs-pull', 'deploy-needs-pull'], []),
+}
+# Changes of these paths run jobs of every service, besides changes of the service directory.
+GITLAB_CI_SHARED_CHANGES = ['.gitlab-ci.yml', f'{GITLAB_CI_DIR_NAME}/**/*', 'docker-compose*.yml']
+GITLAB_CI_GLOBAL_KEYWORDS = ['default', 'include', 'stages', 'variables', 'workflow']
+GITLAB_CI_KEY_LINE_PATTERN = re.compile(r'(?P<name>[^\s#:][^#]*?):(?:\s+(?P<value>[^#\s][^#]*?))?\s*(?:#.*)?')
+GITLAB_CI_BUILDKIT_STUB_NAMES = ['build-service-image']
+GITLAB_CI_BUILDKIT_VARIABLES = {'DOCKER_BUILDKIT': '1', 'COMPOSE_DOCKER_CLI_BUILD': '1'}
+# Push image built with `docker-compose.deploy.testing.yml`, which tags it as the branch cache image.
+GITLAB_CI_BUILDKIT_SCRIPT = [
+    'CACHE_IMAGE="$CI_REGISTRY_IMAGE/__SERVICE_NAME__/cache:$CI_COMMIT_REF_SLUG"',
+    'if docker image inspect "$CACHE_IMAGE" > /dev/null 2>&1; then docker push "$CACHE_IMAGE" || true; fi',
+]
+# Umask can only be read by setting it, so it is read once at import, before any worker thread creates files.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+release_versions_cache = None
+bundle_manifest = None
+bundle_dir_path = None
+release_versions_lock = threading.Lock()
+http_session = None
+refreshed_template_mirrors = set()
+template_mirror_locks = {}
+composer_install_times = {}
+platform_checks = {}
+profile_events = None
+profile_started_at = time.perf_counter()
+profile_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_indenting_yaml_dumper():
+    import yaml
+
+    class IndentingDumper(yaml.SafeDumper):
+        """YAML dumper indenting sequences nested in mappings"""
+
+        def increase_indent(self, flow=False, indentless=False):
+            return super().increase_indent(flow, False)
+
+    return IndentingDumper
+
+
+@lru_cache(maxsize=None)
+def get_gitlab_ci_yaml_loader():
+    import yaml
+
+    class GitlabCiLoader(yaml.SafeLoader):
+        """Safe YAML loader keeping GitLab CI `!reference [job, key]` tags as plain sequences"""
+
+    GitlabCiLoader.add_constructor('!reference', lambda loader, node: loader.construct_sequence(node))
+    return GitlabCiLoader
+
+
+@dataclass
+class Project:
+    """Everything collected about the project before its files are rendered"""
+    name: str
+    client_type: str = CLIENT_TYPES[0]
+    pgbouncer: bool = False
+    api_micro_cache: bool = False
+    sizing: dict = field(default_factory=dict)
+    compose_watch: bool = False
+    auth_service_key: str = field(default_factory=lambda: generate_service_key())
+    user_services: dict = field(default_factory=dict)
+    user_services_local: dict = field(default_factory=dict)
+    databases: list = field(default_factory=lambda: ['auth'])
+    service_keys: list = field(default_factory=list)
+    dot_env: list = field(default_factory=list)
+    dot_env_example: list = field(default_factory=list)
+    service_jobs: list = field(default_factory=list)
+
+
+@contextmanager
+def profile_span(name, category='phase', **args):
+    """Record wall time of the block as Chrome trace event, when profiling is enabled"""
+    if profile_events is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        finished_at = time.perf_counter()
+        # Peak resident set size of the installer process so far, kilobytes on Linux.
+        args['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with profile_lock:
+            profile_events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (started_at - profile_started_at) * 1000 ** 2,
+                'dur': (finished_at - started_at) * 1000 ** 2,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+            })
+
+
+def enable_profiling():
+    global profile_events
+    profile_events = []
+
+
+def save_profile(file_name):
+    """Write recorded spans as Chrome trace-event file (chrome://tracing, Perfetto)"""
+    thread_names = [
+        {
+            'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+            'args': {'name': thread.name},
+        }
+        for thread in threading.enumerate() if thread.ident in {event['tid'] for event in profile_events}
+    ]
+    write_file_atomically(file_name, json.dumps({
+        'traceEvents': thread_names + profile_events,
+        'displayTimeUnit': 'ms',
+    }))
+
 
-user_services = {}
-user_services_local = {}
-databases = ['auth']
-service_keys = []
-dot_env = []
-dot_env_example = []
+def get_profile_subprocesses(event, subprocess_events, main_thread_id):
+    """Get subprocess events started inside the span.
+    Spans of the main thread also get subprocesses of worker threads, which it waits for
+    """
+    return [
+        child for child in subprocess_events
+        if event['tid'] in (child['tid'], main_thread_id)
+        and event['ts'] <= child['ts'] < event['ts'] + event['dur']
+    ]
+
+
+def get_profile_subprocess_time(event, subprocess_events, main_thread_id):
+    """Get wall time during which at least one subprocess was running inside the span"""
+    started_at = event['ts']
+    finished_at = event['ts'] + event['dur']
+    intervals = sorted(
+        (child['ts'], min(child['ts'] + child['dur'], finished_at))
+        for child in get_profile_subprocesses(event, subprocess_events, main_thread_id)
+    )
+
+    subprocess_time = 0
+    covered_until = started_at
+    for interval_started_at, interval_finished_at in intervals:
+        interval_started_at = max(interval_started_at, covered_until)
+        if interval_finished_at > interval_started_at:
+            subprocess_time += interval_finished_at - interval_started_at
+            covered_until = interval_finished_at
+
+    return subprocess_time
+
+
+def print_profile_summary():
+    """Print total wall time of every span name, split into subprocess and Python time"""
+    subprocess_events = [event for event in profile_events if event['cat'] == 'subprocess']
+    main_thread_id = threading.main_thread().ident
+    summary = {}
+    for event in profile_events:
+        if event['cat'] == 'subprocess':
+            subprocess_time = event['dur']
+        else:
+            subprocess_time = get_profile_subprocess_time(event, subprocess_events, main_thread_id)
+        row = summary.setdefault((event['cat'], event['name']), [0, 0, 0])
+        row[0] += 1
+        row[1] += event['dur']
+        row[2] += subprocess_time
+
+    from rich.table import Table
+
+    table = Table(title='Profile')
+    table.add_column('Span')
+    table.add_column('Category')
+    table.add_column('Count', justify='right')
+    table.add_column('Wall, s', justify='right')
+    table.add_column('Subprocess, s', justify='right')
+    table.add_column('Python, s', justify='right')
+    for (category, name), (count, wall_time, subprocess_time) in summary.items():
+        table.add_row(
+            name, category, str(count),
+            f'{wall_time / 1000 ** 2:.3f}',
+            f'{subprocess_time / 1000 ** 2:.3f}',
+            f'{(wall_time - subprocess_time) / 1000 ** 2:.3f}',
+        )
+
+    console.print(table)
+
+
+def get_command_name(command):
+    """Get short name of command for profile, e.g. `git clone`"""
+    arguments = iter(command[1:])
+    for argument in arguments:
+        if argument in ['--git-dir', '--work-tree', '-c']:
+            next(arguments, None)
+        elif not argument.startswith('-'):
+            return f'{command[0]} {argument}'
+
+    return command[0]
+
+
+def run_command(command, quiet=False, env=None):
+    """Run command and raise on non-zero exit.
+    With `quiet` output is captured and attached to the raised error instead of being printed
+    """
+    with profile_span(get_command_name(command), 'subprocess', command=command):
+        if quiet:
+            return subprocess.run(
+                command, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env
+            )
 
+        return subprocess.check_call(command, env=env)
 
-def git(*args):
-    return subprocess.check_call(['git'] + list(args))
 
+def git(*args, quiet=False):
+    return run_command(['git'] + list(args), quiet)
 
-def docker(*args):
-    return subprocess.check_call(['docker'] + list(args))
+
+def docker(*args, quiet=False):
+    return run_command(['docker'] + list(args), quiet)
 
 
 def docker_compose_fn(*args):
-    return subprocess.check_call(['docker-compose'] + list(args))
+    return subprocess.check_call(get_docker_compose_command() + list(args))
+
+
+def get_docker_compose_command():
+    """Get `docker-compose` command, falling back to the compose v2 docker plugin"""
+    if probe_platform()['docker-compose']['detail'].startswith('plugin'):
+        return ['docker', 'compose']
+
+    return ['docker-compose']
 
 
 def generate_service_key():
@@ -55,25 +433,102 @@ def generate_service_key():
     return ''.join((random.choice(sample_string)) for x in range(32))
 
 
+def probe_command(command):
+    """Run probe command with timeout.
+    Returns first line of its output, or None if it failed
+    """
+    try:
+        with profile_span(get_command_name(command), 'subprocess', command=command):
+            result = subprocess.run(
+                command,
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                text=True, timeout=PLATFORM_PROBE_TIMEOUT
+            )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    if result.returncode:
+        return None
+
+    return (result.stdout.strip().splitlines() or [''])[0]
+
+
+def probe_platform():
+    """Check binaries, docker daemon, compose and free disk space.
+    Binaries are looked up in PATH without starting them, version probes run at the same time.
+    Results are cached for the session.
+    Returns dict of check names with `ok` flag and `detail`
+    """
+    if platform_checks:
+        return platform_checks
+
+    paths = {name: which(name) for name in ['git', 'docker', 'docker-compose']}
+    probes = {
+        'git': ['git', '--version'],
+        'docker': ['docker', '--version'],
+        'docker daemon': ['docker', 'version', '--format', '{{.Server.Version}}'],
+        'docker compose plugin': ['docker', 'compose', 'version', '--short'],
+        'docker-compose': ['docker-compose', '--version'],
+    }
+
+    with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+        futures = {
+            name: executor.submit(probe_command, command)
+            for name, command in probes.items()
+            if paths[command[0]]
+        }
+        results = {name: future.result() for name, future in futures.items()}
+
+    checks = {}
+    for name in ['git', 'docker']:
+        if not paths[name]:
+            checks[name] = {'ok': False, 'detail': 'not found in PATH'}
+        else:
+            ok = results[name] is not None
+            checks[name] = {'ok': ok, 'detail': (results[name] or paths[name]) if ok else f'`{name}` is not working'}
+
+    if not paths['docker']:
+        checks['docker daemon'] = {'ok': False, 'detail': '`docker` not found in PATH'}
+    elif results['docker daemon'] is None:
+        checks['docker daemon'] = {'ok': False, 'detail': 'not reachable, is it running?'}
+    else:
+        checks['docker daemon'] = {'ok': True, 'detail': f"server version {results['docker daemon']}"}
+
+    if results.get('docker-compose') is not None:
+        checks['docker-compose'] = {'ok': True, 'detail': results['docker-compose'] or paths['docker-compose']}
+    elif results.get('docker compose plugin') is not None:
+        checks['docker-compose'] = {'ok': True, 'detail': f"plugin `docker compose` {results['docker compose plugin']}"}
+    else:
+        checks['docker-compose'] = {'ok': False, 'detail': 'neither `docker-compose` nor `docker compose` plugin found'}
+
+    free_disk_space = disk_usage('.').free
+    checks['disk space'] = {
+        'ok': free_disk_space >= MIN_FREE_DISK_SPACE,
+        'detail': f'{free_disk_space / 1024 ** 3:.1f} GiB free',
+    }
+
+    platform_checks.update(checks)
+    return platform_checks
+
+
 def check_platform_requirements(platform_requirements, need_exit=True):
-    console.print('Checking platform requirements... [' + ','.join(map(str, platform_requirements)) + ']', style='bold')
+    from rich.markup import escape
 
-    not_installed_requirements_count = 0
-    null = open("/dev/null", "w")
+    console.print(
+        'Checking platform requirements... ' + escape('[' + ','.join(map(str, platform_requirements)) + ']'),
+        style='bold'
+    )
 
-    def check(requirement):
-        try:
-            subprocess.Popen(requirement, stdout=null, stderr=null)
-            return True
-        except OSError:
-            console.print(f'`{requirement}` not found!', style='red bold')
-            return False
+    checks = probe_platform()
+    not_installed_requirements_count = 0
 
     for platform_requirement in platform_requirements:
-        if not check(platform_requirement):
+        if not checks[platform_requirement]['ok']:
+            console.print(f"`{platform_requirement}`: {checks[platform_requirement]['detail']}!", style='red bold')
             not_installed_requirements_count += 1
 
-    null.close()
+    if not checks['disk space']['ok']:
+        console.print(f"Low disk space: {checks['disk space']['detail']}.", style='yellow')
 
     if not_installed_requirements_count > 0:
         if need_exit:
@@ -85,9 +540,150 @@ def check_platform_requirements(platform_requirements, need_exit=True):
     return True
 
 
+def doctor():
+    """Print report of all platform checks"""
+    from rich.table import Table
+    from rich.markup import escape
+
+    started_at = time.monotonic()
+    checks = probe_platform()
+    elapsed = time.monotonic() - started_at
+
+    table = Table(title='Platform')
+    table.add_column('Check')
+    table.add_column('Status')
+    table.add_column('Detail')
+    for name, check in checks.items():
+        if check['ok']:
+            status = '[green]ok'
+        elif name in PLATFORM_REQUIREMENTS:
+            status = '[red]missing'
+        else:
+            status = '[yellow]warning'
+        table.add_row(name, status, escape(check['detail']))
+
+    console.print(table)
+    console.print(f'Checked in {elapsed:.2f}s.', style='dim')
+
+    if not all(checks[requirement]['ok'] for requirement in PLATFORM_REQUIREMENTS):
+        exit(1)
+
+
+def load_release_versions_cache():
+    """Load cached release tags of GitHub repos from the user cache dir"""
+    try:
+        with open(CACHE_DIR / RELEASE_VERSIONS_CACHE_FILE_NAME) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_release_versions_cache(cache):
+    """Write cached release tags of GitHub repos to the user cache dir"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_file_path = CACHE_DIR / RELEASE_VERSIONS_CACHE_FILE_NAME
+    temp_file_path = cache_file_path.with_suffix('.tmp')
+    with open(temp_file_path, 'w') as file:
+        json.dump(cache, file, indent=2)
+    os.replace(temp_file_path, cache_file_path)
+
+
+def get_repo_latest_release_tag(repo_name):
+    """Get latest release tag of egal GitHub repo.
+    Tags younger than RELEASE_VERSIONS_CACHE_TTL are served from the cache without request,
+    older ones are revalidated with `If-None-Match`, so unchanged releases cost no rate limit
+    """
+    global release_versions_cache
+
+    if bundle_manifest is not None:
+        return get_bundle_release_tag(repo_name)
+
+    with release_versions_lock:
+        if release_versions_cache is None:
+            release_versions_cache = load_release_versions_cache()
+        cached = release_versions_cache.get(repo_name)
+
+    if cached and time.time() - cached['fetched_at'] < RELEASE_VERSIONS_CACHE_TTL:
+        return cached['tag_name']
+
+    import requests
+
+    headers = {'Accept': 'application/vnd.github.v3+json'}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if os.environ.get('GITHUB_TOKEN'):
+        headers['Authorization'] = f"token {os.environ['GITHUB_TOKEN']}"
+
+    try:
+        with profile_span('GET releases/latest', 'network', repo=repo_name):
+            response = get_http_session().get(
+                f'{GITHUB_API_URL}/repos/egal/{repo_name}/releases/latest',
+                headers=headers,
+                timeout=GITHUB_API_TIMEOUT
+            )
+        if response.status_code != 304:
+            response.raise_for_status()
+    except requests.RequestException as error:
+        if not cached:
+            raise
+        console.print(f'Can not check `{repo_name}` latest release ({error}), using cached one.', style='yellow')
+        return cached['tag_name']
+
+    if response.status_code == 304:
+        cached = dict(cached, fetched_at=time.time())
+    else:
+        cached = {
+            'tag_name': response.json()['tag_name'],
+            'etag': response.headers.get('ETag'),
+            'fetched_at': time.time(),
+        }
+
+    with release_versions_lock:
+        release_versions_cache[repo_name] = cached
+        save_release_versions_cache(release_versions_cache)
+
+    return cached['tag_name']
+
+
+def get_http_session():
+    """Get HTTP session shared by all requests, so connections are reused"""
+    global http_session
+
+    with release_versions_lock:
+        if http_session is None:
+            import requests
+            http_session = requests.Session()
+
+    return http_session
+
+
+def prefetch_repo_latest_release_versions(repo_names):
+    """Fetch latest release tags of all given repos at the same time, warming up the cache.
+    Exits before anything is generated when a tag can not be resolved and there is no cached one
+    """
+    failures = {}
+    with ThreadPoolExecutor(max_workers=len(repo_names)) as executor:
+        futures = {repo_name: executor.submit(get_repo_latest_release_tag, repo_name) for repo_name in repo_names}
+        for repo_name, future in futures.items():
+            try:
+                future.result()
+            except (OSError, KeyError, ValueError) as error:  # requests.RequestException is an OSError
+                failures[repo_name] = error
+
+    if failures:
+        for repo_name, error in failures.items():
+            console.print(f'Can not resolve `{repo_name}` latest release: {error}', style='red bold')
+        console.print(
+            'Check the network connection to GitHub, set GITHUB_TOKEN if the rate limit is exceeded'
+            ' or install offline with --bundle.',
+            style='red bold'
+        )
+        exit(1)
+
+
 def get_repo_latest_release_version(repo_name, replace_version_prefix=True):
-    response = requests.get(f"https://api.github.com/repos/egal/{repo_name}/releases/latest")
-    tag_name = response.json()['tag_name']
+    with profile_span('get_repo_latest_release_version', repo=repo_name):
+        tag_name = get_repo_latest_release_tag(repo_name)
 
     if replace_version_prefix:
         return tag_name.replace('v', '', 1)
@@ -95,12 +691,169 @@ def get_repo_latest_release_version(repo_name, replace_version_prefix=True):
     return tag_name
 
 
-def update_user_services(service_name, service_path, service_key_env_name):
+def get_template_key(git_repo_url, ref='HEAD'):
+    """Get file name safe key of template repo ref"""
+    return re.sub(r'[^\w.-]+', '_', git_repo_url.split('://')[-1]) + '@' + re.sub(r'[^\w.-]+', '_', ref)
+
+
+def get_template_mirror(git_repo_url):
+    """Get path of the local bare mirror of template repo.
+    The mirror is cloned on first use and refreshed at most once per run,
+    if refreshing fails (e.g. offline) the existing mirror is used as is
+    """
+    mirror_path = TEMPLATES_CACHE_DIR / re.sub(r'[^\w.-]+', '_', git_repo_url.split('://')[-1])
+
+    with template_mirror_locks.setdefault(mirror_path, threading.Lock()):
+        if mirror_path in refreshed_template_mirrors:
+            return mirror_path
+
+        try:
+            if mirror_path.exists():
+                git('--git-dir', str(mirror_path), 'remote', 'update', '--prune', quiet=True)
+            else:
+                TEMPLATES_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                temp_mirror_path = mirror_path.with_suffix('.tmp')
+                if temp_mirror_path.exists():
+                    remove_directory(temp_mirror_path)
+                git('clone', '--quiet', '--mirror', git_repo_url, str(temp_mirror_path), quiet=True)
+                os.replace(temp_mirror_path, mirror_path)
+        except subprocess.CalledProcessError:
+            if not mirror_path.exists():
+                raise
+            console.print(f'Can not refresh `{git_repo_url}`, using cached copy.', style='yellow')
+
+        refreshed_template_mirrors.add(mirror_path)
+
+    return mirror_path
+
+
+def export_template(git_repo_url, destination_path, ref='HEAD'):
+    """Materialize working tree of template repo `ref` into destination_path, without `.git`"""
+    if bundle_manifest is not None:
+        copytree(get_bundle_template_path(git_repo_url, ref), destination_path, symlinks=True)
+        return
+
+    mirror_path = get_template_mirror(git_repo_url)
+    destination_path = Path(destination_path).resolve()
+    destination_path.mkdir(parents=True)
+
+    with tempfile.TemporaryDirectory() as index_dir_path:
+        environment = dict(os.environ, GIT_INDEX_FILE=os.path.join(index_dir_path, 'index'))
+        for command in [['read-tree', ref], ['checkout-index', '--all']]:
+            run_command(
+                ['git', '--git-dir', str(mirror_path), '--work-tree', str(destination_path), '-c', 'core.bare=false']
+                + command,
+                quiet=True, env=environment
+            )
+
+
+def export_bundle(bundle_file_name):
+    """Pack pinned template trees and resolved release versions into one archive for offline installs"""
+    console.print('Exporting bundle...', style='bold')
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'release_versions': {},
+        'templates': {},
+    }
+
+    prefetch_repo_latest_release_versions(RELEASE_VERSIONS_REPOS)
+    for repo_name in RELEASE_VERSIONS_REPOS:
+        manifest['release_versions'][repo_name] = get_repo_latest_release_tag(repo_name)
+
+    with tempfile.TemporaryDirectory() as export_dir_path:
+        with ThreadPoolExecutor(max_workers=len(TEMPLATES)) as executor:
+            futures = []
+            for git_repo_url, ref in TEMPLATES:
+                template_key = get_template_key(git_repo_url, ref)
+                futures.append(executor.submit(
+                    export_template, git_repo_url, f'{export_dir_path}/templates/{template_key}', ref
+                ))
+                manifest['templates'][template_key] = {'url': git_repo_url, 'ref': ref}
+            for future in futures:
+                future.result()
+        for template in manifest['templates'].values():
+            template['commit'] = git(
+                '--git-dir', str(get_template_mirror(template['url'])), 'rev-parse', template['ref'], quiet=True
+            ).stdout.strip()
+
+        with open(f'{export_dir_path}/{BUNDLE_MANIFEST_FILE_NAME}', 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+        temp_bundle_file_name = f'{bundle_file_name}.tmp'
+        with tarfile.open(temp_bundle_file_name, 'w:gz') as archive:
+            # Manifest goes first, so it can be validated before the templates are unpacked.
+            archive.add(f'{export_dir_path}/{BUNDLE_MANIFEST_FILE_NAME}', BUNDLE_MANIFEST_FILE_NAME)
+            archive.add(f'{export_dir_path}/templates', 'templates')
+        os.replace(temp_bundle_file_name, bundle_file_name)
+
+    for template_key, template in manifest['templates'].items():
+        console.print(f"  {template_key} {template['commit'][:12]}")
+    for repo_name, tag_name in manifest['release_versions'].items():
+        console.print(f'  {repo_name} {tag_name}')
+    console.print(f'Bundle saved to `{bundle_file_name}`.', style='green bold')
+
+
+def use_bundle(bundle_file_name):
+    """Serve templates and release versions from bundle instead of network.
+    The bundle is unpacked in one streaming pass into the user cache dir once, and reused by later runs
+    """
+    global bundle_manifest, bundle_dir_path
+
+    bundle_stat = os.stat(bundle_file_name)
+    bundle_key = hashlib.sha256(
+        f'{os.path.abspath(bundle_file_name)}:{bundle_stat.st_size}:{bundle_stat.st_mtime_ns}'.encode()
+    ).hexdigest()[:16]
+    bundle_dir_path = BUNDLES_CACHE_DIR / bundle_key
+
+    if not bundle_dir_path.exists():
+        BUNDLES_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_bundle_dir_path = Path(tempfile.mkdtemp(dir=BUNDLES_CACHE_DIR))
+        try:
+            with tarfile.open(bundle_file_name, 'r|gz') as archive:
+                # `data` filter (Python 3.12+ and recent bugfix releases) rejects paths escaping the target dir.
+                archive.extractall(temp_bundle_dir_path, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+            os.replace(temp_bundle_dir_path, bundle_dir_path)
+        except BaseException:
+            remove_directory(temp_bundle_dir_path, ignore_errors=True)
+            raise
+
+    with open(bundle_dir_path / BUNDLE_MANIFEST_FILE_NAME) as file:
+        manifest = json.load(file)
+
+    if manifest.get('format') != BUNDLE_FORMAT:
+        console.print(f'Unsupported bundle format `{manifest.get("format")}`!', style='red bold')
+        exit(1)
+
+    missing = [
+        f'release version of `{repo_name}`'
+        for repo_name in RELEASE_VERSIONS_REPOS if repo_name not in manifest['release_versions']
+    ] + [
+        f'template `{git_repo_url}` ({ref})'
+        for git_repo_url, ref in TEMPLATES if get_template_key(git_repo_url, ref) not in manifest['templates']
+    ]
+    if missing:
+        console.print(f'Bundle `{bundle_file_name}` has no ' + ', '.join(missing) + '!', style='red bold')
+        exit(1)
+
+    bundle_manifest = manifest
+    console.print(f"Using bundle `{bundle_file_name}` created at {manifest['created_at']}.", style='bold')
+
+
+def get_bundle_release_tag(repo_name):
+    return bundle_manifest['release_versions'][repo_name]
+
+
+def get_bundle_template_path(git_repo_url, ref):
+    return bundle_dir_path / 'templates' / get_template_key(git_repo_url, ref)
+
+
+def update_user_services(project, service_name, service_path, service_key_env_name):
     """Update dict user_services with new service"""
-    user_services[service_name] = {
+    project.user_services[service_name] = {
         'build': {'context': service_path},
         'restart': 'unless-stopped',
-        'depends_on': ['rabbitmq', 'postgres'],
+        'depends_on': get_healthy_depends_on(['rabbitmq', 'postgres']),
         'environment': {
             'APP_NAME': '${PROJECT_NAME}',
             'APP_SERVICE_NAME': get_shorten_service_name(service_name),
@@ -111,43 +864,235 @@ def update_user_services(service_name, service_path, service_key_env_name):
             'RABBITMQ_HOST': 'rabbitmq',
             'RABBITMQ_USER': '${RABBITMQ_USER}',
             'RABBITMQ_PASSWORD': '${RABBITMQ_PASSWORD}',
+            'RABBITMQ_PREFETCH_COUNT': f'${{RABBITMQ_PREFETCH_COUNT:-{RABBITMQ_PREFETCH_COUNT}}}',
             'WAIT_HOSTS': 'rabbitmq:5672,postgres:5432',
         },
     }
+    if project.pgbouncer:
+        connect_through_pgbouncer(project.user_services[service_name])
 
 
-def update_user_services_local(service_name, service_path):
-    """Update dict user_services_local with new service"""
-    user_services_local[service_name] = {
+def update_user_services_local(project, service_name, service_path):
+    """Update dict user_services_local with new service.
+    Code is bind-mounted, or synced by `docker compose watch` with `compose_watch`
+    """
+    definition = {
         'build': {'args': {'DEBUG': 'true'}},
         'user': '${UID}:${GID}',
-        'volumes': [f'./{service_path}:/app:rw'],
+        'volumes': [f'./{LOCAL_PHP_INI_FILE_NAME}:{LOCAL_PHP_INI_TARGET}:ro'],
     }
 
+    if project.compose_watch:
+        definition['develop'] = {
+            'watch': [
+                {
+                    'action': 'sync',
+                    'path': f'./{service_path}',
+                    'target': '/app',
+                    'ignore': [f'{path}/' for path in LOCAL_WATCH_IGNORED_DIRS],
+                },
+                {'action': 'rebuild', 'path': f'./{service_path}/composer.lock'},
+            ],
+        }
+    else:
+        # vendor/ stays on the bind mount, `composer install` run as `${UID}:${GID}` has to write it.
+        definition['volumes'].insert(0, f'./{service_path}:/app:rw')
+
+    project.user_services_local[service_name] = definition
+
+
+def render_local_php_ini():
+    return ''.join(f'{name} = {value}\n' for name, value in LOCAL_PHP_INI_SETTINGS.items())
+
+
+def get_file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def init_user_service_dir(service_path, git_repo_url, on_step=lambda step: None, composer_cache=False):
+    """Initialize directory containing source code for specific service.
+    Runs quietly, so several services can be initialized at the same time.
+    With `composer_cache` packages are taken from the shared COMPOSER_CACHE_DIR
+    """
+    on_step('copying template')
+    export_template(git_repo_url, service_path)
 
-def init_user_service_dir(service_path, git_repo_url):
-    """Initialize directory containing source code for specific service"""
-    git('clone', git_repo_url, service_path)
-    remove_directory(f'{service_path}/.git')
+    if composer_cache:
+        cache_arguments = ['--volume', f'{COMPOSER_CACHE_DIR}:/tmp/cache:rw', '--env', 'COMPOSER_CACHE_DIR=/tmp/cache']
+    else:
+        cache_arguments = []
+
+    on_step('installing dependencies')
+    started_at = time.monotonic()
     docker(
         'run',
-        '--rm', '--interactive', '--tty',
+        '--rm',
         '--volume', f'{pathlib.Path().resolve()}/{service_path}:/app:rw',
+        *cache_arguments,
         '--user', f'{os.getuid()}:{os.getgid()}',
         'composer', 'install',
-        '--ignore-platform-reqs', '--no-cache',
-        '--no-interaction', '--no-progress'
+        '--ignore-platform-reqs',
+        *([] if composer_cache else ['--no-cache']),
+        '--no-interaction', '--no-progress',
+        quiet=True
     )
 
+    lock_file_path = Path(service_path) / 'composer.lock'
+    lock_hash = get_file_hash(lock_file_path) if lock_file_path.is_file() else None
+    composer_install_times[service_path] = (lock_hash, time.monotonic() - started_at)
+
+
+def deduplicate_vendor_dirs(service_paths):
+    """Replace identical files in `vendor/` of services sharing the same composer.lock with hardlinks.
+    Returns count of saved bytes
+    """
+    vendor_paths_by_lock_hash = {}
+    for service_path in service_paths:
+        lock_file_path = Path(service_path) / 'composer.lock'
+        vendor_path = Path(service_path) / 'vendor'
+        if lock_file_path.is_file() and vendor_path.is_dir():
+            vendor_paths_by_lock_hash.setdefault(get_file_hash(lock_file_path), []).append(vendor_path)
+
+    saved_bytes = 0
+    for origin_vendor_path, *vendor_paths in vendor_paths_by_lock_hash.values():
+        for vendor_path in vendor_paths:
+            for file_path in vendor_path.rglob('*'):
+                origin_file_path = origin_vendor_path / file_path.relative_to(vendor_path)
+                if file_path.is_symlink() or origin_file_path.is_symlink():
+                    continue
+                if not file_path.is_file() or not origin_file_path.is_file():
+                    continue
+                if os.path.samefile(file_path, origin_file_path):
+                    continue
+                if not filecmp.cmp(file_path, origin_file_path, shallow=False):
+                    continue
+
+                file_size = file_path.stat().st_size
+                link_path = file_path.with_name(file_path.name + '.egal-installer-link')
+                try:
+                    os.link(origin_file_path, link_path)
+                    os.replace(link_path, file_path)
+                except OSError:
+                    continue
+                saved_bytes += file_size
+
+    return saved_bytes
+
+
+def get_composer_cache_saved_seconds(composer_cache):
+    """Compare composer install times of this run with the stored cold (uncached) install time of the same composer.lock.
+    Uncached installs update the stored reference, the first install of an unknown composer.lock becomes one
+    """
+    install_times_file_path = CACHE_DIR / COMPOSER_INSTALL_TIMES_FILE_NAME
+    try:
+        with open(install_times_file_path) as file:
+            cold_install_times = json.load(file)
+    except (OSError, ValueError):
+        cold_install_times = {}
+
+    saved_seconds = 0
+    for lock_hash, seconds in composer_install_times.values():
+        if lock_hash is None:
+            continue
+        if not composer_cache or lock_hash not in cold_install_times:
+            cold_install_times[lock_hash] = seconds
+        else:
+            saved_seconds += max(cold_install_times[lock_hash] - seconds, 0)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(install_times_file_path, 'w') as file:
+        json.dump(cold_install_times, file, indent=2)
+
+    return saved_seconds
+
+
+def run_service_jobs(jobs, limit=SERVICE_JOBS_LIMIT, composer_cache=False, on_done=lambda service_path: None):
+    """Run `init_user_service_dir` for every (service_path, git_repo_url) job on a bounded worker pool.
+    `on_done` is called from the calling thread as soon as a job succeeds.
+    Returns dict of failed service paths with error descriptions
+    """
+    failures = {}
+
+    if not jobs:
+        return failures
 
-def init_auth_service():
+    console.print(f'Initializing {len(jobs)} service directories, {limit} at a time...', style='bold')
+
+    if composer_cache:
+        COMPOSER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+    progress = Progress(
+        SpinnerColumn(finished_text=' '),
+        TextColumn('{task.description}'),
+        TextColumn('{task.fields[step]}'),
+        console=console.get(),
+    )
+
+    def run(service_path, git_repo_url, task_id):
+        progress.start_task(task_id)
+        with profile_span('init_user_service_dir', service_path=service_path):
+            init_user_service_dir(
+                service_path,
+                git_repo_url,
+                on_step=lambda step: progress.update(task_id, step=f'[yellow]{step}...'),
+                composer_cache=composer_cache
+            )
+
+    with progress, ThreadPoolExecutor(max_workers=limit) as executor:
+        futures = {}
+        for service_path, git_repo_url in jobs:
+            task_id = progress.add_task(service_path, total=1, start=False, step='[dim]queued')
+            futures[executor.submit(run, service_path, git_repo_url, task_id)] = (service_path, task_id)
+
+        for future in as_completed(futures):
+            service_path, task_id = futures[future]
+            try:
+                future.result()
+                progress.update(task_id, completed=1, step='[green]done')
+                on_done(service_path)
+            except (subprocess.CalledProcessError, OSError) as error:
+                failures[service_path] = describe_job_error(error)
+                progress.update(task_id, completed=1, step='[red]failed')
+
+    return failures
+
+
+def describe_job_error(error):
+    """Get short description of failed job error with the tail of command output"""
+    description = str(error)
+    output = getattr(error, 'output', None)
+    if output:
+        description += '\n' + '\n'.join(output.strip().splitlines()[-10:])
+
+    return description
+
+
+def report_job_failures(failures):
+    """Print all collected job failures at once"""
+    console.print(f'{len(failures)} service directories failed to initialize:', style='red bold')
+    for service_path, description in failures.items():
+        console.print(f'`{service_path}`:', style='red bold')
+        console.print(description, style='red', markup=False, highlight=False)
+
+
+def init_auth_service(project, auth_service_type=None):
     """Initialize auth-service directory based on build type selection.
     Returns dict type definition of auth-service
     """
-    auth_service_type = questionary.select(
-        'What build type of auth-service you need?',
-        choices=['Build from image', 'Build from context'
-    ]).ask()
+    if auth_service_type is None:
+        import questionary
+
+        auth_service_type = questionary.select(
+            'What build type of auth-service you need?',
+            choices=AUTH_SERVICE_TYPES
+        ).ask()
     auth_service_name = 'auth-service'
 
     if auth_service_type == 'Build from image':
@@ -159,12 +1104,12 @@ def init_auth_service():
         auth_service_definition = {
             'build': {'context': auth_service_path},
         }
-        update_user_services_local(auth_service_name, auth_service_path)
-        init_user_service_dir(auth_service_path, 'https://github.com/egal/auth-service.git')
+        update_user_services_local(project, auth_service_name, auth_service_path)
+        project.service_jobs.append((auth_service_path, AUTH_SERVICE_REPO_URL))
 
     auth_service_definition.update({
         'restart': 'unless-stopped',
-        'depends_on': ['rabbitmq', 'postgres'],
+        'depends_on': get_healthy_depends_on(['rabbitmq', 'postgres']),
         'environment': {
             'APP_NAME': '${PROJECT_NAME}',
             'APP_SERVICE_NAME': 'auth',
@@ -176,23 +1121,156 @@ def init_auth_service():
             'RABBITMQ_HOST': 'rabbitmq',
             'RABBITMQ_USER': '${RABBITMQ_USER}',
             'RABBITMQ_PASSWORD': '${RABBITMQ_PASSWORD}',
+            'RABBITMQ_PREFETCH_COUNT': f'${{RABBITMQ_PREFETCH_COUNT:-{RABBITMQ_PREFETCH_COUNT}}}',
             'WAIT_HOSTS': 'rabbitmq:5672,postgres:5432',
         },
     })
 
-    user_services[auth_service_name] = auth_service_definition
+    if project.pgbouncer:
+        connect_through_pgbouncer(auth_service_definition)
+
+    project.user_services[auth_service_name] = auth_service_definition
     console.print(f'Service `{auth_service_name}` added!', style='green bold')
 
 
-def yml_beautify(file_name):
-    """Add extra break before lines starting with `- `"""
-    with open(file_name, 'r+') as f:
-        file_data = f.read()
-        file_data = re.sub('- ', '  - ', file_data, flags=re.MULTILINE)
-        f.seek(0)
-        f.write(file_data)
-        f.truncate()
-        f.close()
+def add_user_service(project, service_name):
+    """Register new service: key, database, env and compose definitions, directory initialization job"""
+    import inflection
+
+    service_key = generate_service_key()
+    project.databases.append(get_shorten_service_name(service_name))
+    project.service_keys.append(get_shorten_service_name(service_name) + ':' + service_key)
+    service_path = f'server/{service_name}'
+    service_key_env_name = inflection.underscore(service_name).upper() + '_KEY'
+    project.dot_env.append(service_key_env_name + '=' + service_key)
+    project.dot_env_example.append(service_key_env_name + '=')
+
+    update_user_services(project, service_name, service_path, service_key_env_name)
+    update_user_services_local(project, service_name, service_path)
+    project.service_jobs.append((service_path, PHP_PROJECT_REPO_URL))
+
+    console.print(f'Service `{service_name}` added!', style='green bold')
+
+
+def load_project_spec(spec_file_name):
+    """Load and validate YAML (or JSON) project spec used instead of prompts.
+    Example:
+        name: my-project
+        client: Vue.js
+        auth_service: Build from image
+        pgbouncer: false
+        api_micro_cache: false
+        compose_watch: false
+        services:
+          - core-service
+          - notification-service
+        sizing:
+          core-service:
+            production: {replicas: 4, cpus: 2, memory: 2048}
+    """
+    import yaml
+
+    try:
+        with open(spec_file_name) as file:
+            spec = yaml.safe_load(file)
+    except (OSError, yaml.YAMLError) as error:
+        console.print(f'Can not read project spec `{spec_file_name}`: {error}', style='red bold')
+        exit(1)
+
+    errors = []
+    if not isinstance(spec, dict):
+        spec = {}
+        errors.append('spec must be a mapping')
+    if not isinstance(spec.get('name'), str) or not spec['name']:
+        errors.append('`name` must be a non-empty string')
+    if spec.get('client', CLIENT_TYPES[0]) not in CLIENT_TYPES:
+        errors.append('`client` must be one of: ' + ', '.join(CLIENT_TYPES))
+    if spec.get('auth_service', AUTH_SERVICE_TYPES[0]) not in AUTH_SERVICE_TYPES:
+        errors.append('`auth_service` must be one of: ' + ', '.join(AUTH_SERVICE_TYPES))
+    for option in ['pgbouncer', 'api_micro_cache', 'compose_watch']:
+        if not isinstance(spec.get(option, False), bool):
+            errors.append(f'`{option}` must be true or false')
+
+    service_names = spec.get('services', [])
+    if not isinstance(service_names, list) or not all(isinstance(name, str) and name for name in service_names):
+        errors.append('`services` must be a list of service names')
+    else:
+        for service_name in sorted(set(service_names)):
+            if service_names.count(service_name) > 1:
+                errors.append(f'service name `{service_name}` is used more than once')
+            if service_name in RESERVED_SERVICE_NAMES:
+                errors.append(f'service name `{service_name}` is reserved')
+            if not is_valid_service_name(service_name):
+                errors.append(f'service name `{service_name}` must consist of {SERVICE_NAME_FORMAT}')
+        for i, service_name in enumerate(service_names):
+            if service_name not in RESERVED_SERVICE_NAMES and service_name not in service_names[:i] and \
+                    is_service_name_in_use(service_name, service_names[:i]):
+                errors.append(
+                    f'service name `{service_name}` gives the same database and app name'
+                    f' `{get_shorten_service_name(service_name)}` as another service'
+                )
+
+    sizing = spec.get('sizing', {})
+    if not isinstance(sizing, dict):
+        errors.append('`sizing` must be a mapping of service names')
+        sizing = {}
+    for service_name, environments in sizing.items():
+        if service_name not in ['web-service', 'auth-service'] + (service_names if isinstance(service_names, list) else []):
+            errors.append(f'`sizing` has unknown service `{service_name}`')
+        elif not isinstance(environments, dict) or not set(environments) <= set(SERVICE_SIZING):
+            errors.append(f'`sizing.{service_name}` must be a mapping of: ' + ', '.join(SERVICE_SIZING))
+        else:
+            for environment, environment_sizing in environments.items():
+                if not isinstance(environment_sizing, dict) or not all(
+                    is_valid_sizing_value(name, value) for name, value in environment_sizing.items()
+                ):
+                    errors.append(
+                        f'`sizing.{service_name}.{environment}` may only set replicas (integer, 0 or more),'
+                        ' cpus (positive number) and memory (MiB, positive integer)'
+                    )
+
+    if errors:
+        console.print(f'Invalid project spec `{spec_file_name}`:', style='red bold')
+        for error in errors:
+            console.print(f'  {error}', style='red')
+        exit(1)
+
+    return {
+        'name': spec['name'],
+        'client': spec.get('client', CLIENT_TYPES[0]),
+        'auth_service': spec.get('auth_service', AUTH_SERVICE_TYPES[0]),
+        'pgbouncer': spec.get('pgbouncer', False),
+        'api_micro_cache': spec.get('api_micro_cache', False),
+        'sizing': sizing,
+        'compose_watch': spec.get('compose_watch', False),
+        'services': service_names,
+    }
+
+
+def is_valid_service_name(service_name):
+    """Service name is used as compose service, directory and database name, so it is kept path and SQL safe"""
+    return isinstance(service_name, str) and SERVICE_NAME_PATTERN.fullmatch(service_name) is not None
+
+
+def is_service_name_in_use(service_name, service_names):
+    """Whether service name or its shorten name, used as database and app name, is taken by reserved or given services"""
+    taken_names = set(RESERVED_SERVICE_NAMES) | set(service_names)
+    return service_name in taken_names or get_shorten_service_name(service_name) in map(
+        get_shorten_service_name, taken_names
+    )
+
+
+def is_valid_sizing_value(name, value):
+    if isinstance(value, bool):
+        return False
+    if name == 'replicas':
+        return isinstance(value, int) and value >= 0
+    if name == 'cpus':
+        return isinstance(value, (int, float)) and value > 0
+    if name == 'memory':
+        return isinstance(value, int) and value > 0
+
+    return False
 
 
 def get_shorten_service_name(service_name):
@@ -200,73 +1278,198 @@ def get_shorten_service_name(service_name):
     return re.sub('-service', '', service_name)
 
 
-def main():
-    print("""
+def get_healthy_depends_on(service_names):
+    """Get `depends_on` definition starting service only after its dependencies are healthy"""
+    return {service_name: {'condition': 'service_healthy'} for service_name in service_names}
 
-    ███████╗ ██████╗  █████╗ ██╗
-    ██╔════╝██╔════╝ ██╔══██╗██║
-    █████╗  ██║  ███╗███████║██║
-    ██╔══╝  ██║   ██║██╔══██║██║
-    ███████╗╚██████╔╝██║  ██║███████╗
-    ╚══════╝ ╚═════╝ ╚═╝  ╚═╝╚══════╝
-              Installer
 
-    """)
+def connect_through_pgbouncer(service_definition):
+    """Point postgres connection of service definition at PgBouncer"""
+    service_definition['depends_on']['pgbouncer'] = {'condition': 'service_started'}
 
-    check_platform_requirements(PLATFORM_REQUIREMENTS)
+    environment = {}
+    for name, value in service_definition['environment'].items():
+        environment[name] = value
+        if name == 'DB_HOST':
+            environment.update({'DB_HOST': 'pgbouncer', 'DB_PORT': str(PGBOUNCER_PORT)})
+    environment['WAIT_HOSTS'] = f'rabbitmq:5672,pgbouncer:{PGBOUNCER_PORT}'
+    service_definition['environment'] = environment
 
-    # ------------------------------------- Checking dir is empty ------------------------------------- #
 
-    initial_count = 0
-    directory = '.'
-    for path in os.listdir(directory):
-        if os.path.isfile(os.path.join(directory, path)):
-            initial_count += 1
+def get_pgbouncer_databases_environment(databases):
+    """Get PgBouncer pool entry of every project database"""
+    return {
+        f'PGBOUNCER_DSN_{i}': f'{database}=host=postgres port=5432 dbname={database}'
+        for i, database in enumerate(databases)
+    }
 
-    if initial_count > 1:
-        console.print('Directory is not empty!', style='red bold')
-        exit(1)
 
-    # -------------------------------------------------------------------------- #
+def get_pgbouncer_service_definition(databases):
+    """Get definition of PgBouncer pooling connections to postgres per transaction"""
+    return {
+        'image': 'bitnami/pgbouncer:1.21.0',
+        'restart': 'unless-stopped',
+        'depends_on': get_healthy_depends_on(['postgres']),
+        'environment': {
+            'POSTGRESQL_HOST': 'postgres',
+            'POSTGRESQL_USERNAME': '${DB_USERNAME}',
+            'POSTGRESQL_PASSWORD': '${DB_PASSWORD}',
+            'PGBOUNCER_PORT': str(PGBOUNCER_PORT),
+            'PGBOUNCER_POOL_MODE': 'transaction',
+            'PGBOUNCER_MAX_CLIENT_CONN': f'${{PGBOUNCER_MAX_CLIENT_CONN:-{PGBOUNCER_MAX_CLIENT_CONN}}}',
+            'PGBOUNCER_DEFAULT_POOL_SIZE': f'${{PGBOUNCER_DEFAULT_POOL_SIZE:-{PGBOUNCER_DEFAULT_POOL_SIZE}}}',
+            'PGBOUNCER_RESERVE_POOL_SIZE': f'${{PGBOUNCER_RESERVE_POOL_SIZE:-{PGBOUNCER_RESERVE_POOL_SIZE}}}',
+            'PGBOUNCER_MAX_PREPARED_STATEMENTS':
+                f'${{PGBOUNCER_MAX_PREPARED_STATEMENTS:-{PGBOUNCER_MAX_PREPARED_STATEMENTS}}}',
+            **get_pgbouncer_databases_environment(databases),
+        },
+    }
 
-    console.print('Starting...', style='bold')
 
-    project_name = questionary.text('Enter project name:').ask()
-    client_type = questionary.select('What type of client you need?', choices=['Vue.js', 'Nuxt.js']).ask()
-    client_path = 'client'
+def get_postgres_production_definition(databases_count, pgbouncer):
+    """Get production postgres definition tuned for POSTGRES_PRODUCTION_MEMORY.
+    Behind PgBouncer connections are limited by the pools, otherwise by POSTGRES_MAX_CONNECTIONS
+    """
+    if pgbouncer:
+        max_connections = (
+            databases_count * (PGBOUNCER_DEFAULT_POOL_SIZE + PGBOUNCER_RESERVE_POOL_SIZE)
+            + POSTGRES_RESERVED_CONNECTIONS
+        )
+    else:
+        max_connections = POSTGRES_MAX_CONNECTIONS
+
+    megabyte = 1024 ** 2
+    shared_buffers = POSTGRES_PRODUCTION_MEMORY // 4
+    settings = {
+        'max_connections': max_connections,
+        'shared_buffers': f'{shared_buffers // megabyte}MB',
+        'effective_cache_size': f'{POSTGRES_PRODUCTION_MEMORY * 3 // 4 // megabyte}MB',
+        'maintenance_work_mem': f'{POSTGRES_PRODUCTION_MEMORY // 16 // megabyte}MB',
+        'work_mem': f'{max((POSTGRES_PRODUCTION_MEMORY - shared_buffers) // (max_connections * 3) // megabyte, 4)}MB',
+    }
 
-    if client_type == 'Vue.js':
-        git_repo_url = 'https://github.com/egal/vue-project.git'
-        git('clone', '--branch', 'vue3-template', git_repo_url, client_path)
-    elif client_type == 'Nuxt.js':
-        git_repo_url = 'https://github.com/egal/nuxt-project.git'
-        git('clone', git_repo_url, client_path)
+    command = ['postgres']
+    for name, value in settings.items():
+        command += ['-c', f'{name}={value}']
 
-    remove_directory(f'{client_path}/.git')
-    console.print('Client added!', style='green bold')
+    return {
+        'command': command,
+        'deploy': {'resources': {'limits': {'memory': f'{POSTGRES_PRODUCTION_MEMORY // megabyte}M'}}},
+    }
 
-    init_auth_service()
 
-    while questionary.confirm('Create new service?').ask():
-        service_name = questionary.text('Enter service name, for example `core-service`:').ask()
-        if service_name in user_services:
-            console.print('This service name is already in use. Please choose another name.', style='red bold')
-            continue
+def get_php_fpm_pool_settings(memory):
+    """Get PHP-FPM process manager settings fitting workers into container memory limit in MiB"""
+    max_children = max(memory // PHP_FPM_WORKER_MEMORY - 1, 2)
+    start_servers = max(max_children // 4, 1)
+    return {
+        'pm': 'dynamic',
+        'pm.max_children': max_children,
+        'pm.start_servers': start_servers,
+        'pm.min_spare_servers': start_servers,
+        'pm.max_spare_servers': max(max_children // 2, start_servers),
+        'pm.max_requests': PHP_FPM_MAX_REQUESTS,
+    }
+
+
+def render_php_fpm_pool_config(memory):
+    settings = get_php_fpm_pool_settings(memory)
+    return '[www]\n' + ''.join(f'{name} = {value}\n' for name, value in settings.items())
 
-        service_key = generate_service_key()
-        databases.append(get_shorten_service_name(service_name))
-        service_keys.append(get_shorten_service_name(service_name) + ':' + service_key)
-        service_path = f'server/{service_name}'
-        service_key_env_name = inflection.underscore(service_name).upper() + '_KEY'
-        dot_env.append(service_key_env_name + '=' + service_key)
-        dot_env_example.append(service_key_env_name + '=')
 
-        update_user_services(service_name, service_path, service_key_env_name)
-        update_user_services_local(service_name, service_path)
-        init_user_service_dir(service_path, 'https://github.com/egal/php-project.git')
+def get_php_fpm_pool_volume(memory):
+    return f'./{PHP_FPM_POOL_FILE_NAME.format(memory=memory)}:{PHP_FPM_POOL_TARGET}:ro'
 
-        console.print(f'Service `{service_name}` added!', style='green bold')
 
+def get_service_sizing(project, service_name, environment):
+    return {**SERVICE_SIZING[environment], **project.sizing.get(service_name, {}).get(environment, {})}
+
+
+def get_deploy_service_definition(service_name, sizing, php_fpm=True):
+    """Get deploy definition of service sized for environment.
+    Replicas can be changed without editing files with `<SERVICE_NAME>_REPLICAS` variable
+    """
+    import inflection
+
+    replicas_env_name = inflection.underscore(service_name).upper() + '_REPLICAS'
+    definition = {
+        'deploy': {
+            'replicas': f"${{{replicas_env_name}:-{sizing['replicas']}}}",
+            'resources': {
+                'limits': {'cpus': f"{sizing['cpus']:g}", 'memory': f"{sizing['memory']}M"},
+                'reservations': {'cpus': f"{sizing['cpus'] / 2:g}", 'memory': f"{sizing['memory'] // 2}M"},
+            },
+        },
+    }
+    if php_fpm:
+        definition['volumes'] = [get_php_fpm_pool_volume(sizing['memory'])]
+
+    return definition
+
+
+def get_deploy_services_definitions(project, environment):
+    """Get deploy definitions of `web-service` and every service of `user_services` sized for environment"""
+    definitions = {}
+    for service_name in ['web-service'] + list(project.user_services):
+        definitions[service_name] = get_deploy_service_definition(
+            service_name, get_service_sizing(project, service_name, environment),
+            php_fpm=service_name != 'web-service',
+        )
+
+    return definitions
+
+
+def get_rabbitmq_config_volume(environment):
+    return f'./{RABBITMQ_CONFIG_DIR_NAME}/{environment}.conf:{RABBITMQ_CONFIG_TARGET}:ro'
+
+
+def get_rabbitmq_deploy_definition(environment):
+    """Get deploy definition of rabbitmq with config and memory limit of environment"""
+    return {
+        'volumes': [get_rabbitmq_config_volume(environment)],
+        'deploy': {'resources': {'limits': {'memory': f"{RABBITMQ_ENVIRONMENTS[environment]['memory']}M"}}},
+    }
+
+
+def render_rabbitmq_config(environment):
+    """Get `rabbitmq.conf` of environment"""
+    settings = RABBITMQ_ENVIRONMENTS[environment]
+    memory = settings['memory'] * 1024 ** 2
+    lines = [
+        f'# Broker settings of {environment} environment, sizes are in bytes.',
+        f'vm_memory_high_watermark.absolute = {int(memory * RABBITMQ_MEMORY_HIGH_WATERMARK)}',
+        f'disk_free_limit.absolute = {memory}',
+        f"connection_max = {settings['connection_max']}",
+        f"channel_max = {settings['channel_max']}",
+        'heartbeat = 30',
+        'tcp_listen_options.backlog = 1024',
+        'tcp_listen_options.nodelay = true',
+        'collect_statistics_interval = 30000',
+    ]
+
+    return '\n'.join(lines) + '\n'
+
+
+def get_deploy_testing_service_definition(service_name):
+    """Get `docker-compose.deploy.testing.yml` definition of service built from context.
+    BuildKit takes layers from the cache image of the branch, falling back to the default branch one.
+    Built image carries its cache inline and is tagged as the cache image of the branch, build job pushes it
+    """
+    cache_image = '${CI_REGISTRY_IMAGE}/' + service_name + '/cache'
+    return {
+        'image': f'{cache_image}:${{CI_COMMIT_REF_SLUG}}',
+        'build': {
+            'args': {
+                'DEBUG': 'true',
+                'BUILDKIT_INLINE_CACHE': '1',
+            },
+            'cache_from': [f'{cache_image}:${{CI_COMMIT_REF_SLUG}}', f'{cache_image}:${{CI_DEFAULT_BRANCH}}'],
+        }
+    }
+
+
+def render_docker_compose_files(project):
+    """Get dict of compose file names with their definitions"""
     docker_compose = {
         'version': DOCKER_COMPOSE_VERSION,
         'services': {
@@ -276,13 +1479,14 @@ def main():
                 'environment': {
                     'POSTGRES_USER': '${DB_USERNAME}',
                     'POSTGRES_PASSWORD': '${DB_PASSWORD}',
-                    'POSTGRES_MULTIPLE_DATABASES': ','.join(map(str, databases)),
+                    'POSTGRES_MULTIPLE_DATABASES': ','.join(map(str, project.databases)),
                 },
                 'healthcheck': {
-                    'test': 'pg_isready --username=${DB_USERNAME} --dbname=auth',
-                    'interval': '30s',
-                    'timeout': '30s',
-                    'retries': 3,
+                    'test': POSTGRES_HEALTHCHECK_TEST,
+                    'interval': '5s',
+                    'timeout': '5s',
+                    'retries': 5,
+                    'start_period': '30s',
                 },
             },
             'rabbitmq': {
@@ -292,17 +1496,22 @@ def main():
                     'RABBITMQ_USER': '${RABBITMQ_USER}',
                     'RABBITMQ_PASSWORD': '${RABBITMQ_PASSWORD}',
                 },
+                'volumes': [get_rabbitmq_config_volume('local')],
+                'ulimits': {
+                    'nofile': {'soft': RABBITMQ_NOFILE_LIMIT, 'hard': RABBITMQ_NOFILE_LIMIT},
+                },
                 'healthcheck': {
                     'test': 'rabbitmq-diagnostics -q ping',
-                    'interval': '30s',
-                    'timeout': '30s',
-                    'retries': 3,
+                    'interval': '5s',
+                    'timeout': '10s',
+                    'retries': 5,
+                    'start_period': '60s',
                 },
             },
             'web-service': {
                 'image': f"egalbox/web-service:{get_repo_latest_release_version('web-service')}",
                 'restart': 'unless-stopped',
-                'depends_on': ['rabbitmq'],
+                'depends_on': get_healthy_depends_on(['rabbitmq']),
                 'environment': {
                     'APP_NAME': '${PROJECT_NAME}',
                     'APP_SERVICE_NAME': 'web',
@@ -315,8 +1524,11 @@ def main():
         },
     }
 
-    for service_name in user_services:
-        docker_compose['services'][service_name] = user_services[service_name]
+    if project.pgbouncer:
+        docker_compose['services']['pgbouncer'] = get_pgbouncer_service_definition(project.databases)
+
+    for service_name in project.user_services:
+        docker_compose['services'][service_name] = project.user_services[service_name]
 
     docker_compose_local = {
         'version': DOCKER_COMPOSE_VERSION,
@@ -335,20 +1547,15 @@ def main():
 
     docker_compose_deploy_testing = {
         'version': DOCKER_COMPOSE_VERSION,
-        'services': {}
+        'services': {
+            'rabbitmq': {'volumes': [get_rabbitmq_config_volume('testing')]},
+        }
     }
 
-    for service_name in user_services_local:
-        docker_compose_local['services'][service_name] = user_services_local[service_name]
-        if 'build' in user_services[service_name]:
-            docker_compose_deploy_testing['services'][service_name] = {
-                'build': {
-                    'args': {
-                        'DEBUG': 'true'
-                    }
-                }
-            }
-        docker_compose['services']['postgres']['healthcheck']['test'] += ' && pg_isready --username=${DB_USERNAME} --dbname=' + get_shorten_service_name(service_name)
+    for service_name in project.user_services_local:
+        docker_compose_local['services'][service_name] = project.user_services_local[service_name]
+        if 'build' in project.user_services[service_name]:
+            docker_compose_deploy_testing['services'][service_name] = get_deploy_testing_service_definition(service_name)
 
     docker_compose_deploy = {
         'version': DOCKER_COMPOSE_VERSION,
@@ -371,205 +1578,1214 @@ def main():
 
     docker_compose_deploy_develop = {
         'version': DOCKER_COMPOSE_VERSION,
-        'services': {}
+        'services': {
+            'rabbitmq': get_rabbitmq_deploy_definition('development'),
+            **get_deploy_services_definitions(project, 'development'),
+        }
     }
 
     docker_compose_deploy_stage = {
         'version': DOCKER_COMPOSE_VERSION,
-        'services': {}
+        'services': {
+            'rabbitmq': get_rabbitmq_deploy_definition('staging'),
+            **get_deploy_services_definitions(project, 'staging'),
+        }
     }
 
     docker_compose_deploy_production = {
         'version': DOCKER_COMPOSE_VERSION,
-        'services': {}
+        'services': {
+            'postgres': get_postgres_production_definition(len(project.databases), project.pgbouncer),
+            'rabbitmq': get_rabbitmq_deploy_definition('production'),
+            **get_deploy_services_definitions(project, 'production'),
+        }
     }
 
-    file = open(DOCKER_COMPOSE_DEPLOY_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_deploy, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    file = open(DOCKER_COMPOSE_DEPLOY_DEVELOP_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_deploy_develop, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    file = open(DOCKER_COMPOSE_DEPLOY_STAGE_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_deploy_stage, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    file = open(DOCKER_COMPOSE_DEPLOY_PRODUCTION_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_deploy_production, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    file = open(DOCKER_COMPOSE_FILE_NAME, 'w+')
-    yaml.dump(docker_compose, file, default_flow_style=False, sort_keys=False)
-    file.close()
-    yml_beautify(DOCKER_COMPOSE_FILE_NAME)
-
-    file = open(DOCKER_COMPOSE_LOCAL_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_local, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    file = open(DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME, 'w+')
-    yaml.dump(docker_compose_deploy_testing, file, default_flow_style=False, sort_keys=False)
-    file.close()
-
-    dot_env_example_file = open(DOT_ENV_EXAMPLE_FILE_NAME, 'w+')
-    dot_env_example_file.write(f'PROJECT_NAME={project_name}\n')
-    dot_env_example_file.write(f'COMPOSE_PROJECT_NAME={project_name}\n')
-    dot_env_example_file.write(f'COMPOSE_FILE={DOCKER_COMPOSE_FILE_NAME}:{DOCKER_COMPOSE_LOCAL_FILE_NAME}\n')
-    dot_env_example_file.write('RABBITMQ_USER=user\n')
-    dot_env_example_file.write('DB_USERNAME=user\n')
-    dot_env_example_file.close()
-
-    copy_file(DOT_ENV_EXAMPLE_FILE_NAME, DOT_ENV_FILE_NAME)
-
-    dot_env_example_file = open(DOT_ENV_EXAMPLE_FILE_NAME, 'a')
-    dot_env_example_file.write('RABBITMQ_PASSWORD=\n')
-    dot_env_example_file.write('DB_PASSWORD=\n')
-    dot_env_example_file.write(f'AUTH_SERVICE_KEY=\n')
-    dot_env_example_file.write('AUTH_SERVICE_ENVIRONMENT_APP_SERVICES=\n')
-    dot_env_example_file.write('\n'.join(map(str, dot_env_example)) + '\n')
-    dot_env_example_file.write('#UID=\n')
-    dot_env_example_file.write('#GID=\n')
-    dot_env_example_file.close()
-
-    dot_env_file = open(DOT_ENV_FILE_NAME, 'a')
-    dot_env_file.write('RABBITMQ_PASSWORD=password\n')
-    dot_env_file.write('DB_PASSWORD=password\n')
-    dot_env_file.write(f'AUTH_SERVICE_KEY={generate_service_key()}\n')
-    dot_env_file.write('AUTH_SERVICE_ENVIRONMENT_APP_SERVICES=' + ','.join(map(str, service_keys)) + '\n')
-    dot_env_file.write('\n'.join(map(str, dot_env)) + '\n')
-    dot_env_file.write(f'UID={os.getuid()}\n')
-    dot_env_file.write(f'GID={os.getgid()}\n')
-    dot_env_file.close()
-
-    dot_env_example_file.close()
-
-    file = open(GITIGNORE_FILE_NAME, 'w')
-    file.write('\n'.join(map(str, ['.env', '.idea', 'egal-installer*'])) + '\n')
-    file.close()
-
-    # ------------------------------------- server/proxy init ------------------------------------- #
-
-    # TODO: server/proxy templates and configs.
+    return {
+        DOCKER_COMPOSE_FILE_NAME: docker_compose,
+        DOCKER_COMPOSE_LOCAL_FILE_NAME: docker_compose_local,
+        DOCKER_COMPOSE_DEPLOY_FILE_NAME: docker_compose_deploy,
+        DOCKER_COMPOSE_DEPLOY_DEVELOP_FILE_NAME: docker_compose_deploy_develop,
+        DOCKER_COMPOSE_DEPLOY_STAGE_FILE_NAME: docker_compose_deploy_stage,
+        DOCKER_COMPOSE_DEPLOY_PRODUCTION_FILE_NAME: docker_compose_deploy_production,
+        DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME: docker_compose_deploy_testing,
+    }
+
+
+def dump_docker_compose(definition, indent_sequences=False):
+    """Dump compose file definition with libyaml.
+    `indent_sequences` keeps nested sequences indented, libyaml has no option for it, so it costs the Python emitter
+    """
+    import yaml
+
+    dumper = get_indenting_yaml_dumper() if indent_sequences else getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    return yaml.dump(definition, Dumper=dumper, default_flow_style=False, sort_keys=False)
+
+
+def load_docker_compose(file_name):
+    import yaml
+
+    with open(file_name) as file:
+        return yaml.load(file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def render_dot_env_files(project):
+    """Get contents of `.env` and `.env.example`"""
+    common_lines = [
+        f'PROJECT_NAME={project.name}',
+        f'COMPOSE_PROJECT_NAME={project.name}',
+        f'COMPOSE_FILE={DOCKER_COMPOSE_FILE_NAME}:{DOCKER_COMPOSE_LOCAL_FILE_NAME}',
+        'RABBITMQ_USER=user',
+        f'RABBITMQ_PREFETCH_COUNT={RABBITMQ_PREFETCH_COUNT}',
+        'DB_USERNAME=user',
+    ]
+    if project.pgbouncer:
+        common_lines += [
+            f'PGBOUNCER_MAX_CLIENT_CONN={PGBOUNCER_MAX_CLIENT_CONN}',
+            f'PGBOUNCER_DEFAULT_POOL_SIZE={PGBOUNCER_DEFAULT_POOL_SIZE}',
+            f'PGBOUNCER_RESERVE_POOL_SIZE={PGBOUNCER_RESERVE_POOL_SIZE}',
+            f'PGBOUNCER_MAX_PREPARED_STATEMENTS={PGBOUNCER_MAX_PREPARED_STATEMENTS}',
+        ]
+    dot_env_example_lines = common_lines + [
+        'RABBITMQ_PASSWORD=',
+        'DB_PASSWORD=',
+        'AUTH_SERVICE_KEY=',
+        'AUTH_SERVICE_ENVIRONMENT_APP_SERVICES=',
+        '\n'.join(map(str, project.dot_env_example)),
+        '#UID=',
+        '#GID=',
+    ]
+    dot_env_lines = common_lines + [
+        'RABBITMQ_PASSWORD=password',
+        'DB_PASSWORD=password',
+        f'AUTH_SERVICE_KEY={project.auth_service_key}',
+        'AUTH_SERVICE_ENVIRONMENT_APP_SERVICES=' + ','.join(map(str, project.service_keys)),
+        '\n'.join(map(str, project.dot_env)),
+        f'UID={os.getuid()}',
+        f'GID={os.getgid()}',
+    ]
+
+    return {
+        DOT_ENV_FILE_NAME: '\n'.join(dot_env_lines) + '\n',
+        DOT_ENV_EXAMPLE_FILE_NAME: '\n'.join(dot_env_example_lines) + '\n',
+    }
+
+
+def render_project_files(project):
+    """Render compose files, rabbitmq, php and php-fpm configs, `.env`, `.env.example` and `.gitignore`
+    of the project in one pass.
+    Returns dict of file names with their contents
+    """
+    files = {}
+    for file_name, definition in render_docker_compose_files(project).items():
+        # The main compose file is the one people read, it keeps nested sequences indented.
+        files[file_name] = dump_docker_compose(definition, indent_sequences=file_name == DOCKER_COMPOSE_FILE_NAME)
+
+    for environment in RABBITMQ_ENVIRONMENTS:
+        files[f'{RABBITMQ_CONFIG_DIR_NAME}/{environment}.conf'] = render_rabbitmq_config(environment)
+    files[LOCAL_PHP_INI_FILE_NAME] = render_local_php_ini()
+    for memory in sorted({
+        get_service_sizing(project, service_name, environment)['memory']
+        for service_name in project.user_services for environment in SERVICE_SIZING
+    }):
+        files[PHP_FPM_POOL_FILE_NAME.format(memory=memory)] = render_php_fpm_pool_config(memory)
+    files.update(render_dot_env_files(project))
+    files[GITIGNORE_FILE_NAME] = '\n'.join(map(str, ['.env', '.idea', 'egal-installer*'])) + '\n'
+
+    return files
+
+
+def write_file_atomically(file_name, content):
+    """Write file via temporary file in the same directory and rename, so it is never left half-written.
+    Replaced file keeps its mode, so e.g. `.env` made private by the user stays private
+    """
+    directory = os.path.dirname(file_name) or '.'
+    try:
+        mode = stat.S_IMODE(os.stat(file_name).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    descriptor, temp_file_name = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(file_name)}.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(content)
+        os.chmod(temp_file_name, mode)
+        os.replace(temp_file_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_file_name):
+            remove_file(temp_file_name)
+        raise
+
+
+def write_project_files(files):
+    """Write rendered project files, each one atomically"""
+    for file_name, content in files.items():
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        write_file_atomically(file_name, content)
+
+
+def load_gitlab_ci_stubs(gitlab_ci_dir_path):
+    """Read per-service GitLab CI stubs of exported GitLab CI repo, scoped to service changes
+    and precompiled into parts around `__SERVICE_NAME__`
+    """
+    stubs_dir_path = f'{gitlab_ci_dir_path}/stubs'
+    contents = {
+        file_path.name: file_path.read_text()
+        for file_path in sorted(Path(gitlab_ci_dir_path).glob('*.yml')) + sorted(Path(stubs_dir_path).glob('*.stub'))
+    }
+    missing_stub_file_names = [
+        f'{stub_name}.yml.stub'
+        for deploy_stub_names, testing_stub_names in GITLAB_CI_SERVICE_STUB_NAMES.values()
+        for stub_name in deploy_stub_names + testing_stub_names if f'{stub_name}.yml.stub' not in contents
+    ]
+    if missing_stub_file_names:
+        console.print(
+            f'GitLab CI stubs not found in `{stubs_dir_path}`: ' + ', '.join(missing_stub_file_names), style='red bold'
+        )
+        exit(1)
+
+    return prepare_gitlab_ci_stubs(contents)
+
+
+def prepare_gitlab_ci_stubs(contents):
+    """Scope stubs to service changes, add BuildKit settings to build stubs and split them around `__SERVICE_NAME__`.
+    Contents are GitLab CI files and stubs by file name, stubs which can not be patched are left as they are
+    """
+    definitions = {}
+    for file_name, content in contents.items():
+        try:
+            definitions[file_name] = yaml_load_gitlab_ci(content)
+        except ValueError as error:
+            console.print(f'Can not parse GitLab CI file `{file_name}`: {error}', style='yellow')
+    templates = get_gitlab_ci_templates(definitions.values())
+
+    stubs = {}
+    for key, (deploy_stub_names, testing_stub_names) in GITLAB_CI_SERVICE_STUB_NAMES.items():
+        stub_names = deploy_stub_names + testing_stub_names
+        # Jobs of a service `need` each other, so either all of them are scoped or none.
+        scoped_stubs = None
+        if len(definitions) == len(contents) and not any(
+            has_gitlab_ci_job_conditions(job, templates)
+            for stub_name in stub_names for job in get_gitlab_ci_jobs(definitions[f'{stub_name}.yml.stub']).values()
+        ):
+            try:
+                scoped_stubs = {
+                    stub_name: scope_gitlab_ci_stub(contents[f'{stub_name}.yml.stub']) for stub_name in stub_names
+                }
+            except ValueError as error:
+                console.print(f'Can not scope jobs of services with `{key}`: {error}', style='yellow')
+        if scoped_stubs is None:
+            console.print(
+                f'Jobs of services with `{key}` are not scoped to service changes,'
+                ' some of them have own `rules`, `only` or `except`, extend unknown templates'
+                ' or can not be parsed.',
+                style='yellow'
+            )
+
+        for stub_name in stub_names:
+            stub = scoped_stubs[stub_name] if scoped_stubs else contents[f'{stub_name}.yml.stub']
+            if stub_name in GITLAB_CI_BUILDKIT_STUB_NAMES:
+                try:
+                    stub = add_gitlab_ci_stub_script(
+                        add_gitlab_ci_stub_variables(stub, GITLAB_CI_BUILDKIT_VARIABLES), GITLAB_CI_BUILDKIT_SCRIPT
+                    )
+                except ValueError as error:
+                    console.print(f'Can not enable BuildKit in `{stub_name}` jobs: {error}', style='yellow')
+            stubs[stub_name] = stub.split('__SERVICE_NAME__')
+
+    return stubs
+
+
+def yaml_load_gitlab_ci(content):
+    """Load GitLab CI file as a mapping, `!reference` tags are loaded as they are.
+    Raises ValueError when it is not valid YAML or not a mapping
+    """
+    import yaml
+
+    try:
+        definition = yaml.load(content, Loader=get_gitlab_ci_yaml_loader())
+    except yaml.YAMLError as error:
+        raise ValueError(str(error).replace('\n', ' ')) from error
+    if definition is None:
+        return {}
+    if not isinstance(definition, dict):
+        raise ValueError('top level has to be a mapping')
+
+    return definition
 
-    proxy_dir_path = 'server/proxy'
-    Path(proxy_dir_path).mkdir(parents=True)
-    testing_template_conf_file_name = 'testing.template.conf'
-    proxy_development_template_conf = open(f'{proxy_dir_path}/{testing_template_conf_file_name}', 'w+')
-    proxy_development_template_conf.write("""__UPSTREAMS__
 
-server {
-    listen      80;
-    server_name __SERVER_NAME__;
+def get_gitlab_ci_blocks(content):
+    """Split GitLab CI file into top-level blocks of (name, key line, body, whole block),
+    name is None for leading comments and document markers.
+    Raises ValueError on top-level lines which are not `name:` keys
+    """
+    blocks = []
+    for block in re.split(r'^(?=[^\s#])', content, flags=re.MULTILINE):
+        key_line, _, body = block.partition('\n')
+        if not block or key_line.startswith('#') or re.match(r'(?:---|\.\.\.)(?:\s|$)|%', key_line):
+            blocks.append((None, key_line, body, block))
+            continue
+
+        match = GITLAB_CI_KEY_LINE_PATTERN.fullmatch(key_line.rstrip())
+        if not match:
+            raise ValueError(f'unexpected top-level line `{key_line}`')
+        name, value = match.group('name', 'value')
+        if value and not value.startswith('&') and not name.startswith('.') and name not in GITLAB_CI_GLOBAL_KEYWORDS:
+            raise ValueError(f'job `{name}` has to be a block mapping')
+        blocks.append((name, key_line, body, block))
+
+    return blocks
+
+
+def get_gitlab_ci_indent(body):
+    match = re.search(r'^([ \t]+)\S', body, flags=re.MULTILINE)
+    return match.group(1) if match else '  '
+
 
-    location / {
-        proxy_pass http://client@__SERVER_NAME__;
+def get_gitlab_ci_jobs(definition):
+    """Get every job of loaded GitLab CI file by name, templates (hidden jobs) and global keywords are left out"""
+    return {
+        name: job for name, job in definition.items()
+        if not str(name).startswith('.') and name not in GITLAB_CI_GLOBAL_KEYWORDS
     }
 
-    location /api {
-        rewrite ^/api(.*) /$1  break;
-        proxy_pass http://web-service@__SERVER_NAME__;
+
+def get_gitlab_ci_templates(definitions):
+    """Get every top-level mapping of loaded GitLab CI files by name, jobs can extend hidden and regular jobs"""
+    return {
+        name: job
+        for definition in definitions for name, job in definition.items()
+        if name not in GITLAB_CI_GLOBAL_KEYWORDS and isinstance(job, dict)
     }
-}
-""")
-    proxy_development_template_conf.close()
 
-    copy_file(f'{proxy_dir_path}/{testing_template_conf_file_name}', f'{proxy_dir_path}/development.template.conf')
-    copy_file(f'{proxy_dir_path}/{testing_template_conf_file_name}', f'{proxy_dir_path}/staging.template.conf')
-    copy_file(f'{proxy_dir_path}/{testing_template_conf_file_name}', f'{proxy_dir_path}/production.template.conf')
 
-    # ------------------------------------- GitLab CI init ------------------------------------- #
+def has_gitlab_ci_job_conditions(job, templates, seen=()):
+    """Whether job or any template it extends has `rules`, `only` or `except`, extends unknown template
+    or is not a mapping
+    """
+    if not isinstance(job, dict) or any(keyword in job for keyword in ['rules', 'only', 'except']):
+        return True
 
-    console.print('GitLab CI initialization...', style='bold')
+    template_names = job.get('extends', [])
+    if isinstance(template_names, str):
+        template_names = [template_names]
+    if not isinstance(template_names, list):
+        return True
 
-    gitlab_ci_dir_path = '.gitlab-ci'
-    git('clone', 'https://github.com/egal/gitlab-ci.git', gitlab_ci_dir_path)
-    remove_directory(f'{gitlab_ci_dir_path}/.git')
-    remove_file(gitlab_ci_dir_path + '/.gitignore')
-    remove_file(gitlab_ci_dir_path + '/LICENSE')
-    copy_file(gitlab_ci_dir_path + '/stubs/.gitlab-ci.yml.stub', '.gitlab-ci.yml')
+    for template_name in template_names:
+        if template_name not in templates or template_name in seen:
+            return True
+        if has_gitlab_ci_job_conditions(templates[template_name], templates, seen + (template_name,)):
+            return True
 
-    pull_service_image_stub_file = open(gitlab_ci_dir_path + '/stubs/pull-service-image.yml.stub')
-    pull_service_image_stub = pull_service_image_stub_file.read()
-    pull_service_image_stub_file.close()
+    return False
 
-    build_service_image_stub_file = open(gitlab_ci_dir_path + '/stubs/build-service-image.yml.stub')
-    build_service_image_stub = build_service_image_stub_file.read()
-    build_service_image_stub_file.close()
 
-    deploy_needs_build_stub_file = open(gitlab_ci_dir_path + '/stubs/deploy-needs-build.yml.stub')
-    deploy_needs_build_stub = deploy_needs_build_stub_file.read()
-    deploy_needs_build_stub_file.close()
+def update_gitlab_ci_stub_jobs(stub, update_job):
+    """Replace every job of the stub with `update_job(key_line, body, indent)`, other top-level blocks are kept"""
+    blocks = []
+    for name, key_line, body, block in get_gitlab_ci_blocks(stub):
+        if name is not None and not name.startswith('.') and name not in GITLAB_CI_GLOBAL_KEYWORDS:
+            blocks.append(update_job(key_line, body, get_gitlab_ci_indent(body)))
+        else:
+            blocks.append(block)
+
+    return ''.join(blocks)
+
+
+def scope_gitlab_ci_stub(stub):
+    """Add `rules: changes:` to every job of the stub, so it runs only when the service or shared files change.
+    Called only for stubs whose jobs have no `rules`, `only` or `except` of their own or inherited
+    """
+    def scope_job(key_line, body, indent):
+        changes = ['server/__SERVICE_NAME__/**/*'] + GITLAB_CI_SHARED_CHANGES
+        rules = [f'{indent}rules:', f'{indent}  - changes:'] + [f'{indent}      - {path}' for path in changes]
+        return key_line + '\n' + '\n'.join(rules) + '\n' + body
 
-    deploy_needs_pull_stub_file = open(gitlab_ci_dir_path + '/stubs/deploy-needs-pull.yml.stub')
-    deploy_needs_pull_stub = deploy_needs_pull_stub_file.read()
-    deploy_needs_pull_stub_file.close()
+    return update_gitlab_ci_stub_jobs(stub, scope_job)
 
-    migration_needs_build_stub_file = open(gitlab_ci_dir_path + '/stubs/migration-needs-build.yml.stub')
-    migration_needs_build_stub = migration_needs_build_stub_file.read()
-    migration_needs_build_stub_file.close()
 
-    migration_needs_pull_stub_file = open(gitlab_ci_dir_path + '/stubs/migration-needs-pull.yml.stub')
-    migration_needs_pull_stub = migration_needs_pull_stub_file.read()
-    migration_needs_pull_stub_file.close()
+def add_gitlab_ci_stub_variables(stub, variables):
+    """Add variables to every job of the stub, into its own `variables:` when it has one"""
+    def add_job_variables(key_line, body, indent):
+        match = re.search(rf'^{indent}variables:(.*)\n', body, flags=re.MULTILINE)
+        lines = [f"{indent * 2}{name}: '{value}'" for name, value in variables.items()]
+        if match and match.group(1).strip():
+            # Flow style mapping or anchor, can not be extended line by line.
+            return key_line + '\n' + body
+        if match:
+            return key_line + '\n' + body[:match.end()] + '\n'.join(lines) + '\n' + body[match.end():]
 
-    phpcs_stub_file = open(gitlab_ci_dir_path + '/stubs/phpcs.yml.stub')
-    phpcs_stub = phpcs_stub_file.read()
-    phpcs_stub_file.close()
+        return key_line + '\n' + f'{indent}variables:\n' + '\n'.join(lines) + '\n' + body
 
-    phpunit_stub_file = open(gitlab_ci_dir_path + '/stubs/phpunit.yml.stub')
-    phpunit_stub = phpunit_stub_file.read()
-    phpunit_stub_file.close()
+    return update_gitlab_ci_stub_jobs(stub, add_job_variables)
 
-    deploy_file = open('.gitlab-ci/deploy.gitlab-ci.yml', mode='a')
-    testing_file = open('.gitlab-ci/testing.deploy.gitlab-ci.yml', mode='a')
 
+def add_gitlab_ci_stub_script(stub, script_lines):
+    """Append lines to `script:` of every job of the stub which has its own block style `script:`"""
+    def add_job_script(key_line, body, indent):
+        match = re.search(
+            rf'^{indent}script:[ \t]*(?:#.*)?\n((?:{indent}[ \t]*-.*\n|{indent}[ \t]+\S.*\n|[ \t]*\n)*)',
+            body + ('' if body.endswith('\n') else '\n'), flags=re.MULTILINE
+        )
+        if not match or not match.group(1).strip():
+            # No script of its own (inherited one must not be replaced) or flow style one.
+            return key_line + '\n' + body
+
+        item_indent = re.match(r'[ \t]*', match.group(1).lstrip('\n')).group()
+        script_end = match.start(1) + len(match.group(1).rstrip()) + 1
+        lines = [f"{item_indent}- '{line}'" for line in script_lines]
+        return key_line + '\n' + body[:script_end] + '\n'.join(lines) + '\n' + body[script_end:]
+
+    return update_gitlab_ci_stub_jobs(stub, add_job_script)
+
+
+def render_gitlab_ci(stubs, services):
+    """Render jobs of all services in one pass.
+    Returns contents to append to `deploy.gitlab-ci.yml` and `testing.deploy.gitlab-ci.yml`
+    """
+    deploy = []
+    testing = []
+    for service_name, service_definition in services.items():
+        for key, (deploy_stub_names, testing_stub_names) in GITLAB_CI_SERVICE_STUB_NAMES.items():
+            if key in service_definition:
+                for stub_name in deploy_stub_names:
+                    deploy += ['\n', service_name.join(stubs[stub_name])]
+                for stub_name in testing_stub_names:
+                    testing += ['\n', service_name.join(stubs[stub_name])]
+                break
+
+    return ''.join(deploy), ''.join(testing)
+
+
+def render_phpcs_config_equals(service_names):
+    """Get job checking that phpcs configs of all services built from context are equal to the first one"""
     phpcs_config_equals = """phpcs-config-equals:test:
   extends: .template
   stage: testing
   needs:
     - prepare
   script:"""
-    cmp_phpcs_script = ''
-    i = 0
-    for service_name in user_services:
-        if 'build' in user_services[service_name]:
-            i += 1
-            service_build = build_service_image_stub.replace('__SERVICE_NAME__', service_name)
-            service_deploy = deploy_needs_build_stub.replace('__SERVICE_NAME__', service_name)
-            service_migration = migration_needs_build_stub.replace('__SERVICE_NAME__', service_name)
-            service_phpcs = phpcs_stub.replace('__SERVICE_NAME__', service_name)
-            service_phpunit = phpunit_stub.replace('__SERVICE_NAME__', service_name)
-            deploy_file.write("\n" + service_build)
-            deploy_file.write("\n" + service_migration)
-            deploy_file.write("\n" + service_deploy)
-            testing_file.write("\n" + service_phpcs)
-            testing_file.write("\n" + service_phpunit)
-            if i % 2:
-                cmp_phpcs_script += f' cmp -s server/{service_name}/phpcs.xml'
-            else:
-                cmp_phpcs_script += f' server/{service_name}/phpcs.xml &&'
-        elif 'image' in user_services[service_name]:
-            service_pull = pull_service_image_stub.replace('__SERVICE_NAME__', service_name)
-            service_deploy = deploy_needs_pull_stub.replace('__SERVICE_NAME__', service_name)
-            service_migration = migration_needs_pull_stub.replace('__SERVICE_NAME__', service_name)
-            deploy_file.write("\n" + service_pull)
-            deploy_file.write("\n" + service_migration)
-            deploy_file.write("\n" + service_deploy)
-
-    cmp_phpcs_script = re.sub(' &&', '', cmp_phpcs_script)
-    if cmp_phpcs_script.count('server/') > 1:
-        testing_file.write("\n" + phpcs_config_equals + cmp_phpcs_script + "\n")
-    else:
-        testing_file.write("\n" + phpcs_config_equals + " exit 0 # TODO: Need implementation. Example: `cmp -s server/first-service/phpcs.xml server/second-service/phpcs.xml server/third-service/phpcs.xml`" + "\n")
+    config_paths = [f'server/{service_name}/phpcs.xml' for service_name in service_names]
+    commands = [f'cmp -s {config_paths[0]} {config_path}' for config_path in config_paths[1:]]
+
+    if not commands:
+        return "\n" + phpcs_config_equals + " exit 0 # TODO: Need implementation. Example: `cmp -s server/first-service/phpcs.xml server/second-service/phpcs.xml`" + "\n"
+
+    return "\n" + phpcs_config_equals + ''.join(f'\n    - {command}' for command in commands) + "\n"
+
+
+def render_proxy_template(environment, api_micro_cache=False):
+    """Get `server/proxy` nginx template of environment.
+    `__UPSTREAMS__` and `__SERVER_NAME__` are filled in by deploy jobs
+    """
+    settings = PROXY_ENVIRONMENTS[environment]
+    micro_cache = api_micro_cache and settings['api_micro_cache_valid']
+    lines = ['__UPSTREAMS__', '']
+    if micro_cache:
+        lines += [
+            'proxy_cache_path /var/cache/nginx/__SERVER_NAME__ levels=1:2 keys_zone=api@__SERVER_NAME__:10m',
+            '                 max_size=100m inactive=10m use_temp_path=off;',
+            '',
+        ]
+
+    lines += [
+        'server {',
+        '    listen      80;',
+        '    server_name __SERVER_NAME__;',
+        '',
+        '    gzip              on;',
+        f"    gzip_comp_level   {settings['gzip_comp_level']};",
+        '    gzip_min_length   1024;',
+        '    gzip_proxied      any;',
+        '    gzip_vary         on;',
+        '    gzip_types        text/plain text/css text/xml application/json application/javascript',
+        '                      application/xml image/svg+xml;',
+        '',
+        '    # Reuse connections kept open by `keepalive` of the upstreams instead of closing them after every request.',
+        '    proxy_http_version 1.1;',
+        '    proxy_set_header   Connection "";',
+        '',
+        '    proxy_buffering         on;',
+        f"    proxy_buffer_size       {settings['proxy_buffer_size']};",
+        f"    proxy_buffers           {settings['proxy_buffers']};",
+        f"    proxy_busy_buffers_size {settings['proxy_busy_buffers_size']};",
+        f"    client_max_body_size    {settings['client_max_body_size']};",
+        '',
+        '    # Build output of Vue CLI, Vite and Nuxt.js with content hashes in file names,',
+        '    # files copied as is from `public/` keep their names and are not cached.',
+        f'    location ~ "{PROXY_HASHED_ASSET_PATTERN}" {{',
+        '        proxy_pass http://client@__SERVER_NAME__;',
+        '        proxy_hide_header Cache-Control;',
+        '        proxy_hide_header Expires;',
+        '        add_header Cache-Control "public, max-age=31536000, immutable" always;',
+        '    }',
+        '',
+        '    location / {',
+        '        proxy_pass http://client@__SERVER_NAME__;',
+        '    }',
+        '',
+        '    location /api {',
+        '        rewrite ^/api(.*) /$1  break;',
+        '        proxy_pass http://web-service@__SERVER_NAME__;',
+    ]
+    if micro_cache:
+        lines += [
+            '',
+            '        # Anonymous GET and HEAD responses only, authorized ones are neither served from nor saved to cache.',
+            '        proxy_cache              api@__SERVER_NAME__;',
+            f'        proxy_cache_valid        200 {micro_cache};',
+            '        proxy_cache_lock         on;',
+            '        proxy_cache_use_stale    updating;',
+            '        proxy_cache_bypass       $http_authorization $http_cookie;',
+            '        proxy_no_cache           $http_authorization $http_cookie;',
+            '        add_header X-Cache-Status $upstream_cache_status;',
+        ]
+    lines += [
+        '    }',
+        '}',
+    ]
+
+    return '\n'.join(lines) + '\n'
+
+
+def init_proxy_templates(project):
+    """Initialize `server/proxy` nginx templates of every environment"""
+    proxy_dir_path = 'server/proxy'
+    Path(proxy_dir_path).mkdir(parents=True, exist_ok=True)
+    write_project_files({
+        f'{proxy_dir_path}/{environment}.template.conf': render_proxy_template(environment, project.api_micro_cache)
+        for environment in PROXY_ENVIRONMENTS
+    })
+
 
-    deploy_file.close()
-    testing_file.close()
+def export_gitlab_ci_stubs():
+    """Export GitLab CI repo into temporary directory and load its stubs"""
+    with tempfile.TemporaryDirectory() as gitlab_ci_dir_path:
+        export_template(GITLAB_CI_REPO_URL, f'{gitlab_ci_dir_path}/{GITLAB_CI_DIR_NAME}')
+        return load_gitlab_ci_stubs(f'{gitlab_ci_dir_path}/{GITLAB_CI_DIR_NAME}')
+
+
+def init_gitlab_ci(project, stubs):
+    """Initialize GitLab CI files with jobs of all project services from stubs loaded beforehand"""
+    console.print('GitLab CI initialization...', style='bold')
+
+    gitlab_ci_dir_path = GITLAB_CI_DIR_NAME
+    export_template(GITLAB_CI_REPO_URL, gitlab_ci_dir_path)
+    remove_file(gitlab_ci_dir_path + '/.gitignore')
+    remove_file(gitlab_ci_dir_path + '/LICENSE')
+    if not add_gitlab_ci_upstreams_keepalive(gitlab_ci_dir_path):
+        console.print(
+            f'No `upstream` blocks found in `{gitlab_ci_dir_path}`, add `keepalive {PROXY_UPSTREAM_KEEPALIVE};`'
+            ' to the upstreams substituted into `__UPSTREAMS__` by deploy jobs to reuse proxy connections.',
+            style='yellow'
+        )
+    copy_file(gitlab_ci_dir_path + '/stubs/.gitlab-ci.yml.stub', '.gitlab-ci.yml')
+
+    deploy, testing = render_gitlab_ci(stubs, project.user_services)
+    testing += render_phpcs_config_equals(
+        [service_name for service_name in project.user_services if 'build' in project.user_services[service_name]]
+    )
+
+    with open(GITLAB_CI_DEPLOY_FILE_NAME, mode='a') as deploy_file:
+        deploy_file.write(deploy)
+    with open(GITLAB_CI_TESTING_FILE_NAME, mode='a') as testing_file:
+        testing_file.write(testing)
 
     remove_directory(f'{gitlab_ci_dir_path}/stubs')
+
+
+def add_gitlab_ci_upstreams_keepalive(gitlab_ci_dir_path):
+    """Add `keepalive` to nginx `upstream` blocks which deploy jobs substitute into `__UPSTREAMS__`
+    of proxy templates, without it `proxy_http_version 1.1` connections are still closed after every request.
+    Returns count of patched upstream blocks
+    """
+    patched_count = 0
+
+    def add_keepalive(match):
+        nonlocal count
+        opening, body, closing = match.groups()
+        if PROXY_KEEPALIVE_PATTERN.search(body):
+            return match.group(0)
+
+        # `keepalive` goes last, balancing directives like `least_conn` have to come before it
+        count += 1
+        body = body.rstrip()
+        separator = '' if not body or body.endswith(';') else ';'
+        return f'{opening}{body}{separator} keepalive {PROXY_UPSTREAM_KEEPALIVE};{closing}'
+
+    for file_path in Path(gitlab_ci_dir_path).glob('*.yml'):
+        count = 0
+        content = PROXY_UPSTREAM_PATTERN.sub(add_keepalive, file_path.read_text())
+        if count:
+            write_file_atomically(str(file_path), content)
+            patched_count += count
+
+    return patched_count
+
+
+def get_step_input_hash(*inputs):
+    """Get hash of step inputs, the step is done again when they change"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_journal():
+    """Load journal of the interrupted installation in the current directory, None if there is none"""
+    try:
+        with open(JOURNAL_FILE_NAME) as file:
+            journal = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        console.print(f'Can not read `{JOURNAL_FILE_NAME}`: {error}', style='red bold')
+        exit(1)
+
+    if journal.get('format') != JOURNAL_FORMAT:
+        console.print(f'`{JOURNAL_FILE_NAME}` was written by another installer version, can not resume!', style='red bold')
+        exit(1)
+
+    return journal
+
+
+def save_journal(journal):
+    write_file_atomically(JOURNAL_FILE_NAME, json.dumps(journal, indent=2) + '\n')
+
+
+def is_step_done(journal, step, input_hash):
+    return journal['steps'].get(step) == input_hash
+
+
+def complete_step(journal, step, input_hash):
+    """Record step as done with its input hash, right away, so the next `--resume` run skips it"""
+    journal['steps'][step] = input_hash
+    save_journal(journal)
+
+
+def load_journal_project(journal):
+    project = Project(**journal['project'])
+    project.service_jobs = [tuple(job) for job in project.service_jobs]
+    return project
+
+
+def clean_step_path(path):
+    """Remove what an unfinished step left at path"""
+    if os.path.isdir(path):
+        remove_directory(path)
+    elif os.path.exists(path):
+        remove_file(path)
+
+
+def add_profile_arguments(parser, default=None):
+    """Add profiling options, commands get them too with `argparse.SUPPRESS` default, not to reset the global ones"""
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        default=False if default is None else default,
+        help='record timings of installation phases into Chrome trace file',
+    )
+    parser.add_argument(
+        '--profile-output',
+        default=PROFILE_FILE_NAME if default is None else default,
+        metavar='PATH',
+        help=f'trace file written with --profile (default: {PROFILE_FILE_NAME})',
+    )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Egal project installer')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=SERVICE_JOBS_LIMIT,
+        help=f'how many service directories to initialize at the same time (default: {SERVICE_JOBS_LIMIT})',
+    )
+    parser.add_argument(
+        '--spec',
+        metavar='PATH',
+        help='YAML or JSON project spec, installs without any prompts',
+    )
+    add_profile_arguments(parser)
+    parser.add_argument(
+        '--bundle',
+        metavar='PATH',
+        help='take templates and release versions from bundle made by `bundle export`, without network',
+    )
+    parser.add_argument(
+        '--composer-cache',
+        action='store_true',
+        help='share composer cache between services and hardlink identical files of their `vendor/` dirs',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=f'continue interrupted installation from `{JOURNAL_FILE_NAME}`, skipping finished unchanged steps',
+    )
+
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    add_service_parser = subparsers.add_parser(
+        'add-service',
+        help='add one service to the project generated in the current directory',
+    )
+    add_service_parser.add_argument('service_name', metavar='NAME', help='service name, for example `core-service`')
+    add_profile_arguments(add_service_parser, argparse.SUPPRESS)
+    add_service_parser.add_argument(
+        '-y', '--yes',
+        action='store_true',
+        help='rewrite compose files without confirmation even if their comments are lost',
+    )
+    add_profile_arguments(subparsers.add_parser('doctor', help='check platform requirements and exit'), argparse.SUPPRESS)
+    bundle_parser = subparsers.add_parser('bundle', help='manage offline bundles')
+    bundle_subparsers = bundle_parser.add_subparsers(dest='bundle_command', metavar='COMMAND', required=True)
+    bundle_export_parser = bundle_subparsers.add_parser(
+        'export',
+        help='pack templates, GitLab CI stubs and release versions into bundle for offline installs',
+    )
+    bundle_export_parser.add_argument(
+        'bundle_file_name',
+        nargs='?',
+        default=BUNDLE_FILE_NAME,
+        metavar='PATH',
+        help=f'bundle file (default: {BUNDLE_FILE_NAME})',
+    )
+    add_profile_arguments(bundle_export_parser, argparse.SUPPRESS)
+
+    measure_startup_parser = subparsers.add_parser(
+        'measure-startup',
+        help='recreate the stack of the project in the current directory and report time until services are ready',
+    )
+    measure_startup_parser.add_argument(
+        '--timeout',
+        type=int,
+        default=STARTUP_TIMEOUT,
+        metavar='SECONDS',
+        help=f'how long to wait for services to become ready (default: {STARTUP_TIMEOUT})',
+    )
+    add_profile_arguments(measure_startup_parser, argparse.SUPPRESS)
+
+    arguments = parser.parse_args()
+
+    if arguments.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    return arguments
+
+
+def main():
+    arguments = parse_arguments()
+
+    print("""
+
+    ███████╗ ██████╗  █████╗ ██╗
+    ██╔════╝██╔════╝ ██╔══██╗██║
+    █████╗  ██║  ███╗███████║██║
+    ██╔══╝  ██║   ██║██╔══██║██║
+    ███████╗╚██████╔╝██║  ██║███████╗
+    ╚══════╝ ╚═════╝ ╚═╝  ╚═╝╚══════╝
+              Installer
+
+    """)
+
+    if arguments.profile:
+        enable_profiling()
+
+    try:
+        if arguments.bundle:
+            use_bundle(arguments.bundle)
+
+        if arguments.command == 'add-service':
+            add_service(arguments)
+        elif arguments.command == 'doctor':
+            doctor()
+        elif arguments.command == 'measure-startup':
+            measure_startup(arguments)
+        elif arguments.command == 'bundle':
+            export_bundle(arguments.bundle_file_name)
+        else:
+            install(arguments)
+    finally:
+        if arguments.profile:
+            save_profile(arguments.profile_output)
+            print_profile_summary()
+            console.print(f'Profile saved to `{arguments.profile_output}`.', style='bold')
+
+
+def install(arguments):
+    """Generate new project in the current directory"""
+    with profile_span('check_platform_requirements'):
+        check_platform_requirements(PLATFORM_REQUIREMENTS)
+    with profile_span('prefetch_repo_latest_release_versions'):
+        prefetch_repo_latest_release_versions(RELEASE_VERSIONS_REPOS)
+
+    journal = load_journal() if arguments.resume else None
+    resuming = journal is not None
+    if arguments.resume and journal is None:
+        console.print(f'`{JOURNAL_FILE_NAME}` not found, installing from scratch.', style='yellow')
+
+    # ------------------------------------- Checking dir is empty ------------------------------------- #
+
+    initial_count = 0
+    directory = '.'
+    for path in os.listdir(directory):
+        path = os.path.join(directory, path)
+        if os.path.isfile(path) and not (arguments.spec and os.path.samefile(path, arguments.spec)):
+            initial_count += 1
+
+    if initial_count > 1 and journal is None:
+        console.print('Directory is not empty!', style='red bold')
+        if os.path.isfile(JOURNAL_FILE_NAME):
+            console.print('Run with --resume to continue the interrupted installation.', style='yellow')
+        exit(1)
+
+    # -------------------------------------------------------------------------- #
+
+    console.print('Starting...', style='bold')
+
+    project_spec = load_project_spec(arguments.spec) if arguments.spec else None
+    spec_hash = get_step_input_hash(project_spec) if project_spec else None
+
+    if journal:
+        if project_spec and journal['spec_hash'] != spec_hash:
+            console.print('Project spec changed since the interrupted installation, can not resume!', style='red bold')
+            exit(1)
+
+        project = load_journal_project(journal)
+        console.print(f'Resuming installation of `{project.name}`...', style='bold')
+    else:
+        project = collect_project(project_spec)
+        # Only paths left by steps of a journaled installation are cleaned, on a fresh one they are the user's files.
+        existing_paths = [
+            path for path in ['client'] + [service_path for service_path, _ in project.service_jobs] + [GITLAB_CI_DIR_NAME]
+            if os.path.lexists(path)
+        ]
+        if existing_paths:
+            console.print(
+                'Directory already has ' + ', '.join(f'`{path}`' for path in existing_paths) + ', can not install!',
+                style='red bold'
+            )
+            exit(1)
+        journal = {'format': JOURNAL_FORMAT, 'spec_hash': spec_hash, 'project': asdict(project), 'steps': {}}
+
+    # Stubs are loaded before any step, so broken ones stop the installation before it does the long work.
+    gitlab_ci_input_hash = get_step_input_hash(GITLAB_CI_REPO_URL, project.user_services)
+    gitlab_ci_stubs = None
+    if not is_step_done(journal, 'gitlab_ci', gitlab_ci_input_hash):
+        with profile_span('load_gitlab_ci_stubs'):
+            gitlab_ci_stubs = export_gitlab_ci_stubs()
+    save_journal(journal)
+
+    client_path = 'client'
+    client_repo_url, client_ref = CLIENT_TEMPLATES[project.client_type]
+    client_input_hash = get_step_input_hash(client_repo_url, client_ref)
+    if is_step_done(journal, 'client', client_input_hash):
+        console.print('Client is already added.', style='dim')
+    else:
+        with profile_span('init_client'):
+            if resuming:
+                clean_step_path(client_path)
+            export_template(client_repo_url, client_path, client_ref)
+        complete_step(journal, 'client', client_input_hash)
+        console.print('Client added!', style='green bold')
+
+    service_jobs_input_hashes = {
+        service_path: get_step_input_hash(git_repo_url) for service_path, git_repo_url in project.service_jobs
+    }
+    service_jobs = [
+        (service_path, git_repo_url) for service_path, git_repo_url in project.service_jobs
+        if not is_step_done(journal, f'service:{service_path}', service_jobs_input_hashes[service_path])
+    ]
+    if len(service_jobs) < len(project.service_jobs):
+        console.print(
+            f'{len(project.service_jobs) - len(service_jobs)} service directories are already initialized.', style='dim'
+        )
+    if resuming:
+        for service_path, _ in service_jobs:
+            clean_step_path(service_path)
+
+    with profile_span('run_service_jobs'):
+        service_jobs_failures = run_service_jobs(
+            service_jobs, arguments.jobs, arguments.composer_cache,
+            on_done=lambda service_path: complete_step(
+                journal, f'service:{service_path}', service_jobs_input_hashes[service_path]
+            )
+        )
+
+    if service_jobs:
+        composer_cache_saved_seconds = get_composer_cache_saved_seconds(arguments.composer_cache)
+
+        if arguments.composer_cache:
+            composer_cache_saved_bytes = deduplicate_vendor_dirs(
+                service_path for service_path, _ in project.service_jobs if service_path not in service_jobs_failures
+            )
+            console.print(
+                f'Composer cache saved {composer_cache_saved_bytes / 1024 / 1024:.1f} MiB of disk space'
+                f' and {composer_cache_saved_seconds:.1f}s of install time.',
+                style='green bold'
+            )
+
+    with profile_span('render_project_files'):
+        files = render_project_files(project)
+    files_input_hash = get_step_input_hash(files)
+    if not is_step_done(journal, 'project_files', files_input_hash) or not all(map(os.path.isfile, files)):
+        with profile_span('write_project_files'):
+            write_project_files(files)
+        complete_step(journal, 'project_files', files_input_hash)
+
+    proxy_input_hash = get_step_input_hash(project.api_micro_cache, PROXY_ENVIRONMENTS)
+    if not is_step_done(journal, 'proxy_templates', proxy_input_hash):
+        with profile_span('init_proxy_templates'):
+            init_proxy_templates(project)
+        complete_step(journal, 'proxy_templates', proxy_input_hash)
+
+    if gitlab_ci_stubs is not None:
+        with profile_span('init_gitlab_ci'):
+            if resuming:
+                clean_step_path(GITLAB_CI_DIR_NAME)
+            init_gitlab_ci(project, gitlab_ci_stubs)
+        complete_step(journal, 'gitlab_ci', gitlab_ci_input_hash)
+
+    if service_jobs_failures:
+        report_job_failures(service_jobs_failures)
+        console.print('Run again with --resume to retry only the failed steps.', style='yellow')
+        exit(1)
+
+    remove_file(JOURNAL_FILE_NAME)
+
     console.print('Completed!', style='green bold')
 
 
+def collect_project(project_spec=None):
+    """Collect project from spec or prompts, without touching the file system"""
+    if project_spec:
+        project = Project(
+            name=project_spec['name'], client_type=project_spec['client'], pgbouncer=project_spec['pgbouncer'],
+            api_micro_cache=project_spec['api_micro_cache'], sizing=project_spec['sizing'],
+            compose_watch=project_spec['compose_watch']
+        )
+        init_auth_service(project, project_spec['auth_service'])
+        for service_name in project_spec['services']:
+            add_user_service(project, service_name)
+
+        return project
+
+    import questionary
+
+    project = Project(name=questionary.text('Enter project name:').ask())
+    project.client_type = questionary.select('What type of client you need?', choices=CLIENT_TYPES).ask()
+    project.pgbouncer = questionary.confirm(
+        'Do you need PgBouncer connection pooler in front of postgres?', default=False
+    ).ask()
+    project.api_micro_cache = questionary.confirm(
+        'Do you need 1s proxy micro-cache of anonymous API GET requests on staging and production?', default=False
+    ).ask()
+    project.compose_watch = questionary.confirm(
+        'Do you want to sync services code with `docker compose watch` instead of bind mounts?', default=False
+    ).ask()
+
+    init_auth_service(project)
+    while questionary.confirm('Create new service?').ask():
+        service_name = questionary.text('Enter service name, for example `core-service`:').ask()
+        if not is_valid_service_name(service_name):
+            console.print(f'Service name must consist of {SERVICE_NAME_FORMAT}.', style='red bold')
+            continue
+        if is_service_name_in_use(service_name, project.user_services):
+            console.print('This service name is already in use. Please choose another name.', style='red bold')
+            continue
+
+        add_user_service(project, service_name)
+
+    return project
+
+
+def add_service(arguments):
+    """Add one service to the project generated in the current directory.
+    Only the new service entries are added to `.env` files, everything else there is kept as is.
+    Compose files are loaded and dumped again, so their comments and formatting are not kept
+    """
+    check_platform_requirements(PLATFORM_REQUIREMENTS)
+
+    service_name = arguments.service_name
+    if not is_valid_service_name(service_name):
+        console.print(f'Service name must consist of {SERVICE_NAME_FORMAT}.', style='red bold')
+        exit(1)
+
+    patched_file_names = [
+        DOCKER_COMPOSE_FILE_NAME, DOCKER_COMPOSE_LOCAL_FILE_NAME, DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME,
+        DOT_ENV_FILE_NAME, DOT_ENV_EXAMPLE_FILE_NAME,
+    ]
+    for file_name in patched_file_names:
+        if not os.path.isfile(file_name):
+            console.print(f'`{file_name}` not found, is it a generated project directory?', style='red bold')
+            exit(1)
+
+    docker_compose = load_docker_compose(DOCKER_COMPOSE_FILE_NAME)
+    if is_service_name_in_use(service_name, docker_compose['services']):
+        console.print('This service name is already in use. Please choose another name.', style='red bold')
+        exit(1)
+
+    commented_file_names = [
+        file_name for file_name in [
+            DOCKER_COMPOSE_FILE_NAME, DOCKER_COMPOSE_LOCAL_FILE_NAME, DOCKER_COMPOSE_DEPLOY_DEVELOP_FILE_NAME,
+            DOCKER_COMPOSE_DEPLOY_STAGE_FILE_NAME, DOCKER_COMPOSE_DEPLOY_PRODUCTION_FILE_NAME,
+            DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME,
+        ] if has_yaml_comments(file_name)
+    ]
+    if commented_file_names and not arguments.yes:
+        import questionary
+
+        console.print(
+            'Comments and formatting of ' + ', '.join(f'`{name}`' for name in commented_file_names)
+            + ' will be lost, these files are rewritten.',
+            style='yellow'
+        )
+        if not questionary.confirm('Continue?', default=False).ask():
+            exit(1)
+
+    docker_compose_local = load_docker_compose(DOCKER_COMPOSE_LOCAL_FILE_NAME)
+    project = Project(
+        name='', databases=[], pgbouncer='pgbouncer' in docker_compose['services'],
+        compose_watch=any('develop' in service for service in docker_compose_local['services'].values())
+    )
+    add_user_service(project, service_name)
+    files = {}
+
+    docker_compose['services'].update(project.user_services)
+    postgres = docker_compose['services']['postgres']
+    databases = postgres['environment']['POSTGRES_MULTIPLE_DATABASES'].split(',') + project.databases
+    postgres['environment']['POSTGRES_MULTIPLE_DATABASES'] = ','.join(databases)
+    postgres['healthcheck']['test'] = POSTGRES_HEALTHCHECK_TEST
+    if project.pgbouncer:
+        docker_compose['services']['pgbouncer']['environment'].update(get_pgbouncer_databases_environment(databases))
+    files[DOCKER_COMPOSE_FILE_NAME] = dump_docker_compose(docker_compose, indent_sequences=True)
+
+    deploy_file_names = {
+        'development': DOCKER_COMPOSE_DEPLOY_DEVELOP_FILE_NAME,
+        'staging': DOCKER_COMPOSE_DEPLOY_STAGE_FILE_NAME,
+        'production': DOCKER_COMPOSE_DEPLOY_PRODUCTION_FILE_NAME,
+    }
+    for environment, file_name in deploy_file_names.items():
+        if not os.path.isfile(file_name):
+            continue
+        docker_compose_deploy_environment = load_docker_compose(file_name)
+        if environment == 'production':
+            docker_compose_deploy_environment['services'].setdefault('postgres', {}).update(
+                get_postgres_production_definition(len(databases), project.pgbouncer)
+            )
+        docker_compose_deploy_environment['services'][service_name] = get_deploy_service_definition(
+            service_name, SERVICE_SIZING[environment]
+        )
+        pool_file_name = PHP_FPM_POOL_FILE_NAME.format(memory=SERVICE_SIZING[environment]['memory'])
+        if not os.path.isfile(pool_file_name):
+            files[pool_file_name] = render_php_fpm_pool_config(SERVICE_SIZING[environment]['memory'])
+        files[file_name] = dump_docker_compose(docker_compose_deploy_environment)
+
+    docker_compose_local['services'].update(project.user_services_local)
+    files[DOCKER_COMPOSE_LOCAL_FILE_NAME] = dump_docker_compose(docker_compose_local)
+    if not os.path.isfile(LOCAL_PHP_INI_FILE_NAME):
+        files[LOCAL_PHP_INI_FILE_NAME] = render_local_php_ini()
+
+    docker_compose_deploy_testing = load_docker_compose(DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME)
+    docker_compose_deploy_testing['services'][service_name] = get_deploy_testing_service_definition(service_name)
+    files[DOCKER_COMPOSE_DEPLOY_TESTING_FILE_NAME] = dump_docker_compose(docker_compose_deploy_testing)
+
+    with open(DOT_ENV_FILE_NAME) as file:
+        dot_env_lines = file.read().splitlines()
+    insert_lines_before(dot_env_lines, 'UID=', project.dot_env)
+    for i, line in enumerate(dot_env_lines):
+        if line.startswith('AUTH_SERVICE_ENVIRONMENT_APP_SERVICES='):
+            name, _, value = line.partition('=')
+            dot_env_lines[i] = name + '=' + ','.join(filter(None, value.split(',') + project.service_keys))
+    files[DOT_ENV_FILE_NAME] = '\n'.join(dot_env_lines) + '\n'
+
+    with open(DOT_ENV_EXAMPLE_FILE_NAME) as file:
+        dot_env_example_lines = file.read().splitlines()
+    insert_lines_before(dot_env_example_lines, '#UID=', project.dot_env_example)
+    files[DOT_ENV_EXAMPLE_FILE_NAME] = '\n'.join(dot_env_example_lines) + '\n'
+
+    if os.path.isfile(GITLAB_CI_DEPLOY_FILE_NAME) and os.path.isfile(GITLAB_CI_TESTING_FILE_NAME):
+        files.update(render_added_service_gitlab_ci(service_name, project.user_services[service_name], docker_compose))
+    else:
+        console.print('GitLab CI files not found, skipping CI jobs.', style='yellow')
+
+    service_jobs_failures = run_service_jobs(project.service_jobs, arguments.jobs, arguments.composer_cache)
+    if service_jobs_failures:
+        report_job_failures(service_jobs_failures)
+        exit(1)
+
+    write_project_files(files)
+    console.print('Completed!', style='green bold')
+
+
+def has_yaml_comments(file_name):
+    """Whether YAML file has comments, which are lost when it is loaded and dumped again"""
+    if not os.path.isfile(file_name):
+        return False
+
+    with open(file_name) as file:
+        return any(YAML_COMMENT_PATTERN.search(line) for line in file)
+
+
+def insert_lines_before(lines, prefix, new_lines):
+    """Insert new_lines before the first line starting with prefix, or at the end"""
+    index = next((i for i, line in enumerate(lines) if line.startswith(prefix)), len(lines))
+    lines[index:index] = new_lines
+
+
+def render_added_service_gitlab_ci(service_name, service_definition, docker_compose):
+    """Get GitLab CI files with jobs of the added service and updated `phpcs-config-equals` job"""
+    stubs = export_gitlab_ci_stubs()
+    service_deploy, service_testing = render_gitlab_ci(stubs, {service_name: service_definition})
+
+    with open(GITLAB_CI_DEPLOY_FILE_NAME) as file:
+        deploy = file.read()
+    with open(GITLAB_CI_TESTING_FILE_NAME) as file:
+        testing = file.read()
+
+    # `phpcs-config-equals` job lists all services, so it is rendered again after the new service jobs.
+    testing = re.sub(r'\nphpcs-config-equals:test:\n(?:[ \t].*\n?)*', '', testing)
+    testing += service_testing + render_phpcs_config_equals(
+        [name for name, definition in docker_compose['services'].items() if 'build' in definition]
+    )
+
+    return {GITLAB_CI_DEPLOY_FILE_NAME: deploy + service_deploy, GITLAB_CI_TESTING_FILE_NAME: testing}
+
+
+def get_container_state(status):
+    """Get startup state of container from its `docker ps` status"""
+    if status.startswith(('Exited', 'Restarting', 'Dead')) or status.endswith('(unhealthy)'):
+        return 'failed'
+    if not status.startswith('Up'):
+        return 'created'
+    if status.endswith('(health: starting)'):
+        return 'started'
+
+    return 'ready'
+
+
+def get_startup_project_name():
+    """Get compose project name for measuring startup, separate from the project used for development,
+    so its containers and anonymous volumes (postgres data) are never touched
+    """
+    project_name = os.path.basename(os.getcwd())
+    if os.path.isfile(DOT_ENV_FILE_NAME):
+        with open(DOT_ENV_FILE_NAME) as file:
+            for line in file:
+                if line.startswith('COMPOSE_PROJECT_NAME='):
+                    project_name = line.partition('=')[2].strip()
+
+    return re.sub(r'[^a-z0-9_-]', '', project_name.lower()) + '-startup'
+
+
+def get_containers_statuses(project_name):
+    """Get `docker ps` status of containers of compose project by service name"""
+    result = docker(
+        'ps', '--all',
+        '--filter', f'label=com.docker.compose.project={project_name}',
+        '--format', '{{.Label "com.docker.compose.service"}}\t{{.Status}}',
+        quiet=True
+    )
+    return dict(line.split('\t', 1) for line in result.stdout.splitlines() if '\t' in line)
+
+
+def measure_startup(arguments):
+    """Start the stack of the project in the current directory as a separate throwaway compose project,
+    poll its containers until every service is ready, print startup critical path and remove the stack.
+    Published ports are the same, so the development stack has to be stopped first
+    """
+    from rich.table import Table
+
+    if not os.path.isfile(DOCKER_COMPOSE_FILE_NAME):
+        console.print(f'`{DOCKER_COMPOSE_FILE_NAME}` not found, is it a generated project directory?', style='red bold')
+        exit(1)
+
+    check_platform_requirements(PLATFORM_REQUIREMENTS)
+    services = load_docker_compose(DOCKER_COMPOSE_FILE_NAME)['services']
+    project_name = get_startup_project_name()
+    docker_compose_command = get_docker_compose_command() + ['--project-name', project_name]
+    started = {}
+    ready = {}
+    failed = {}
+
+    console.print(f'Starting services as `{project_name}` compose project...', style='bold')
+    try:
+        with tempfile.TemporaryFile('w+') as output:
+            started_at = time.monotonic()
+            process = subprocess.Popen(
+                docker_compose_command + ['up', '--detach'], stdout=output, stderr=subprocess.STDOUT, text=True
+            )
+            while len(ready) + len(failed) < len(services):
+                elapsed = time.monotonic() - started_at
+                if elapsed > arguments.timeout:
+                    break
+
+                for service_name, status in get_containers_statuses(project_name).items():
+                    state = get_container_state(status)
+                    if state in ['started', 'ready']:
+                        started.setdefault(service_name, elapsed)
+                    if state == 'ready':
+                        ready.setdefault(service_name, elapsed)
+                        failed.pop(service_name, None)
+                    elif state == 'failed' and service_name not in ready:
+                        failed.setdefault(service_name, status)
+
+                if process.poll() not in [None, 0]:
+                    output.seek(0)
+                    console.print(output.read())
+                    console.print('Failed to start services!', style='red bold')
+                    exit(1)
+
+                time.sleep(STARTUP_POLL_INTERVAL)
+
+            try:
+                process.wait(timeout=max(arguments.timeout - (time.monotonic() - started_at), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    finally:
+        console.print(f'Removing `{project_name}` compose project...', style='bold')
+        subprocess.run(
+            docker_compose_command + ['down', '--volumes', '--remove-orphans'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    waited_for = {}
+    for service_name in ready:
+        dependencies = [dependency for dependency in services[service_name].get('depends_on', []) if dependency in ready]
+        if dependencies:
+            waited_for[service_name] = max(dependencies, key=ready.get)
+
+    table = Table(title='Startup')
+    table.add_column('Service')
+    table.add_column('Started', justify='right')
+    table.add_column('Ready', justify='right')
+    table.add_column('Own startup', justify='right')
+    table.add_column('Waited for')
+    for service_name in sorted(services, key=lambda name: ready.get(name, float('inf'))):
+        if service_name in ready:
+            table.add_row(
+                service_name,
+                f'{started.get(service_name, ready[service_name]):.1f}s',
+                f'{ready[service_name]:.1f}s',
+                f'{ready[service_name] - started.get(service_name, ready[service_name]):.1f}s',
+                waited_for.get(service_name, ''),
+            )
+        else:
+            table.add_row(service_name, '', f"[red]{failed.get(service_name, 'not ready')}", '', '')
+    console.print(table)
+
+    if ready:
+        critical_path = [max(ready, key=lambda name: (ready[name], name in waited_for))]
+        while critical_path[-1] in waited_for:
+            critical_path.append(waited_for[critical_path[-1]])
+        console.print(
+            'Critical path: ' + ' -> '.join(f'{name} ({ready[name]:.1f}s)' for name in reversed(critical_path)),
+            style='bold'
+        )
+
+    if len(ready) < len(services):
+        console.print(f'{len(services) - len(ready)} of {len(services)} services are not ready!', style='red bold')
+        exit(1)
+
+    console.print(f'All services are ready in {max(ready.values()):.1f}s.', style='green bold')
+
+
 if __name__ == '__main__':
     main()
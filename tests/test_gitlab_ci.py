@@ -0,0 +1,101 @@
+"""Tests of GitLab CI stubs parsing and scoping to service changes.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+TEMPLATES = """.template:
+  image: docker:latest
+.conditional:
+  only:
+    - main
+"""
+STUB = """__JOB__:__SERVICE_NAME__:
+  extends: .template
+  stage: __JOB__
+  script:
+    - docker-compose build __SERVICE_NAME__
+"""
+
+
+def get_contents(stub=STUB, templates=TEMPLATES, **stubs):
+    contents = {'deploy.gitlab-ci.yml': templates}
+    for deploy_stub_names, testing_stub_names in main.GITLAB_CI_SERVICE_STUB_NAMES.values():
+        for stub_name in deploy_stub_names + testing_stub_names:
+            contents[f'{stub_name}.yml.stub'] = stubs.get(stub_name, stub).replace('__JOB__', stub_name)
+
+    return contents
+
+
+def is_scoped(stubs, stub_name):
+    return 'rules:\n    - changes:' in ''.join(stubs[stub_name])
+
+
+def test_stubs_are_scoped():
+    stubs = main.prepare_gitlab_ci_stubs(get_contents())
+
+    assert all(is_scoped(stubs, stub_name) for stub_name in stubs)
+    assert '  - server/__SERVICE_NAME__/**/*\n' in '__SERVICE_NAME__'.join(stubs['phpcs'])
+
+
+def test_stubs_with_document_start_are_scoped():
+    stubs = main.prepare_gitlab_ci_stubs(get_contents('---\n' + STUB))
+
+    assert is_scoped(stubs, 'phpcs')
+    assert ''.join(stubs['phpcs']).startswith('---\n')
+
+
+def test_job_with_own_rules_leaves_its_service_jobs_unscoped():
+    stub = STUB + '  rules:\n    - when: manual\n'
+    stubs = main.prepare_gitlab_ci_stubs(get_contents(phpcs=stub))
+
+    assert not any(is_scoped(stubs, stub_name) for stub_name in ['build-service-image', 'phpcs', 'phpunit'])
+    assert all(is_scoped(stubs, stub_name) for stub_name in ['pull-service-image', 'deploy-needs-pull'])
+
+
+def test_job_extending_conditional_template_is_not_scoped():
+    stub = STUB.replace('extends: .template', 'extends: [.template, .conditional]')
+    stubs = main.prepare_gitlab_ci_stubs(get_contents(stub))
+
+    assert not is_scoped(stubs, 'phpcs')
+
+
+def test_job_extending_unknown_template_is_not_scoped():
+    stubs = main.prepare_gitlab_ci_stubs(get_contents(STUB.replace('.template', '.unknown')))
+
+    assert not is_scoped(stubs, 'phpcs')
+
+
+def test_conditions_in_flow_style_and_comments_are_told_apart():
+    stub = STUB.replace('  stage: __JOB__\n', '  stage: __JOB__ # rules: are set by the template\n')
+    templates = TEMPLATES.replace('.template:\n  image: docker:latest', '.template: {image: docker:latest, only: [main]}')
+
+    assert is_scoped(main.prepare_gitlab_ci_stubs(get_contents(stub)), 'phpcs')
+    assert not is_scoped(main.prepare_gitlab_ci_stubs(get_contents(templates=templates)), 'phpcs')
+
+
+def test_reference_tags_are_loaded():
+    stub = STUB.replace('  script:\n', '  before_script: !reference [.template, image]\n  script:\n')
+
+    assert is_scoped(main.prepare_gitlab_ci_stubs(get_contents(stub)), 'phpcs')
+
+
+def test_unparsable_stubs_are_left_unscoped():
+    stubs = main.prepare_gitlab_ci_stubs(get_contents(STUB + '  script: [\n'))
+
+    assert not any(is_scoped(stubs, stub_name) for stub_name in stubs)
+    assert ''.join(stubs['phpcs']).endswith('  script: [\n')
+
+
+def test_buildkit_script_is_added_to_build_jobs():
+    stubs = main.prepare_gitlab_ci_stubs(get_contents())
+    stub = '__SERVICE_NAME__'.join(stubs['build-service-image'])
+
+    assert "    DOCKER_BUILDKIT: '1'\n" in stub
+    assert stub.index('docker-compose build') < stub.index('CACHE_IMAGE=')
+    assert 'CACHE_IMAGE=' not in ''.join(stubs['phpcs'])